@@ -1,31 +1,95 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Body
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Body, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 
 from typing import List, Dict, Any
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from models import Base, Patient, Results, Letter
-import uuid, csv, io, os
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta
+from sqlalchemy import insert, select, func, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Patient, Results, Letter
+from database import engine, SessionLocal, async_engine, AsyncSessionLocal
+from migrations import upgrade_schema
+from patient_search import ensure_search_index, search_patient_ids
+from result_values import parse_reference_range, numeric_values, BELOW, ABOVE
+import results_analytics
+from job_queue import LetterJobQueue
+from http_utils import VersionCounter, CompressionMiddleware, etag_matches
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from letter_events import EventBroker
+from letter_edits import LetterEditBuffer, EditConflict
+import letter_store
+from letter_store import LetterSummary, LetterDetail
+from letter_cache import LetterCache, cache_key
+import uuid, csv, io, os, json, threading, base64, hashlib, zipfile, asyncio, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import uvicorn
 
-from letter_utils.generate_letter_content import generate_letter_content
-from letter_utils.create_pdf import create_pdf
+from letter_utils.generate_letter_content import generate_letter_content, stream_letter_content
+from letter_utils.create_pdf import (
+    create_pdf, new_letter_uid, render_letter_html, LETTERS_DIR, LETTER_ASSETS, ASSET_VERSION
+)
+from letter_utils.ollama_client import warm_up
+from letter_utils.pdf_pool import PdfRenderPool, PdfPoolBusy
+from letter_utils.lru import SizedLRUCache
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'scribe.db')}"
+LETTER_WORKERS = int(os.environ.get("NHSCRIBE_LETTER_WORKERS", "2"))
+BATCH_CONCURRENCY = int(os.environ.get("NHSCRIBE_BATCH_CONCURRENCY", "2"))
+BATCH_MAX_ITEMS = 500
+RESULTS_CHUNK_SIZE = 500
+LETTER_CACHE_SIZE = int(os.environ.get("NHSCRIBE_LETTER_CACHE_SIZE", "512"))
+PDF_CACHE_BYTES = int(os.environ.get("NHSCRIBE_PDF_CACHE_MB", "32")) * 1024 * 1024
+# "files" writes each letter's page under letters/; "db" renders pages from the database on request
+LETTER_STORAGE = os.environ.get("NHSCRIBE_LETTER_STORAGE", "files")
+LETTER_PAGE_CACHE_BYTES = int(os.environ.get("NHSCRIBE_LETTER_PAGE_CACHE_MB", "8")) * 1024 * 1024
+PDF_WORKERS = int(os.environ.get("NHSCRIBE_PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_RETRY_AFTER = 2
+LETTER_EDIT_RETRY_AFTER = 2
+LETTER_EDIT_DELAY = float(os.environ.get("NHSCRIBE_LETTER_EDIT_DELAY", "2"))
+LETTER_EDIT_MAX_DELAY = float(os.environ.get("NHSCRIBE_LETTER_EDIT_MAX_DELAY", "10"))
+LETTER_EVENTS_PING = float(os.environ.get("NHSCRIBE_LETTER_EVENTS_PING", "15"))
+LLAMA_MODEL = os.environ.get("NHSCRIBE_LLAMA_MODEL", "llama3")
+WARM_UP_MODEL = os.environ.get("NHSCRIBE_WARM_UP_MODEL", "1") == "1"
+
+# Whether the patient name search index exists; set by prepare_database()
+PATIENT_SEARCH_INDEX = False
+
+
+def prepare_database():
+    """Bring the schema, search index and result summary up to date.
+
+    Called from lifespan rather than at import: PDF workers are spawned and
+    re-import this module, and must not touch the database.
+    """
+    global PATIENT_SEARCH_INDEX
+    upgrade_schema(engine)
+    PATIENT_SEARCH_INDEX = ensure_search_index(engine)
+    results_analytics.ensure_result_summary(engine)
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False  
-)
 
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare_database()
+    if WARM_UP_MODEL:
+        # Load the model in the background so startup isn't held up by Ollama
+        threading.Thread(target=warm_up, args=(LLAMA_MODEL,), daemon=True).start()
+    letter_events.start(asyncio.get_running_loop())
+    letter_events.stop_on_exit_signals()
+    letter_jobs.start()
+    pdf_pool.start()
+    yield
+    if not letter_edits.flush_all():
+        print("⚠️ Some letter edits could not be saved before shutdown")
+    letter_events.stop()
+    letter_jobs.stop()
+    pdf_pool.shutdown()
+    await async_engine.dispose()
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Pi-Scribe API")
+app = FastAPI(title="Pi-Scribe API", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="letters"), name="static")
 
@@ -42,7 +106,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "ETag", "Content-Length"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+# Bumped whenever a letter is created or changed; drives the listing ETags
+letters_version = VersionCounter("letters")
+
+# Pushes letter changes to open dashboards (see /letters/events)
+letter_events = EventBroker()
+
 
 def get_db():
     db = SessionLocal()
@@ -52,6 +125,33 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Session for async def endpoints, so waiting on SQLite doesn't hold a threadpool slot."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@app.get("/assets/{name}")
+def get_letter_asset(name: str):
+    """Stylesheet and script shared by the letter pages. URLs carry ?v=<version>, so they never go stale."""
+    asset = LETTER_ASSETS.get(name)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    body, media_type = asset
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={
+            "Cache-Control": f"public, max-age={ASSET_MAX_AGE}, immutable",
+            "ETag": f'"{ASSET_VERSION}"',
+        },
+    )
+
+
 @app.post("/patients/")
 def create_patient(
     name: str = Form(...),
@@ -68,97 +168,201 @@ def create_patient(
     return patient
 
 
+PATIENT_FIELDS = ("id", "name", "age", "sex", "address", "conditions", "patient_code", "date_of_birth")
+PATIENTS_PAGE_MAX = 1000
+
+
 @app.get("/patients/")
-def list_patients(db: Session = Depends(get_db)):
-    return db.query(Patient).all()
+def list_patients(
+    response: Response,
+    fields: str = None,
+    limit: int = 100,
+    after_id: int = 0,
+    db: Session = Depends(get_db)
+):
+    """List patients in id order, a page at a time.
+
+    fields picks the columns returned, e.g. fields=id,name for a picker.
+    The X-Next-After-Id response header is the after_id for the next page.
+    """
+    columns = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(PATIENT_FIELDS)
+    unknown = set(columns) - set(PATIENT_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    limit = max(1, min(limit, PATIENTS_PAGE_MAX))
+    selected = columns if "id" in columns else ["id", *columns]
+
+    # Plain rows of just the requested columns; no ORM objects are built
+    rows = db.execute(
+        select(*(getattr(Patient, c) for c in selected))
+        .where(Patient.id > after_id)
+        .order_by(Patient.id)
+        .limit(limit + 1)
+    ).mappings().all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-After-Id"] = str(rows[-1]["id"])
+
+    return [{c: row[c] for c in columns} for row in rows]
+
+
+PATIENT_SEARCH_MAX = 100
 
 
 @app.get("/patients/search/")
-def search_patients(
+async def search_patients(
     name: str = None,
     age: int = None,
     sex: str = None,
-    db: Session = Depends(get_db)
+    in_details: bool = False,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Search for patients by name, age, or sex"""
-    query = db.query(Patient)
+    """Search for patients by name, age, or sex.
+
+    Names are matched by word prefix, falling back to typo-tolerant matching,
+    and returned best match first. in_details also searches address and conditions.
+    """
+    limit = max(1, min(limit, PATIENT_SEARCH_MAX))
+
+    if name and PATIENT_SEARCH_INDEX:
+        ids = await db.run_sync(search_patient_ids, name, limit=limit, in_details=in_details, age=age, sex=sex)
+        patients = {p.id: p for p in (await db.scalars(select(Patient).where(Patient.id.in_(ids))))}
+        return [patients[i] for i in ids if i in patients]
+
+    query = select(Patient)
     
     if name:
-        query = query.filter(Patient.name.ilike(f"%{name}%"))
+        query = query.where(Patient.name.ilike(f"%{name}%"))
     if age:
-        query = query.filter(Patient.age == age)
+        query = query.where(Patient.age == age)
     if sex:
-        query = query.filter(Patient.sex == sex)
+        query = query.where(Patient.sex == sex)
     
-    return query.all()
+    return (await db.scalars(query.order_by(Patient.id).limit(limit))).all()
+
+
+def parse_date(value: str):
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def parse_result_row(row: Dict[str, Any]):
+    """Normalise one CSV row into Results column values, or None if it has no test/value."""
+    row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+
+    test_name = row.get("test name") or row.get("test") or ""
+    value = row.get("result") or row.get("value") or ""
+    unit = row.get("units", "")
+    flag = row.get("flag", "")
+    ref = row.get("reference range", "")
+
+    if not test_name or not value:
+        return None
+
+    ref_low, ref_high = parse_reference_range(ref)
+
+    return {
+        "test_name": test_name,
+        "value": value,
+        "unit": unit,
+        "flag": flag,
+        "reference_low": ref_low,
+        "reference_high": ref_high,
+        "sample_date": parse_date(row.get("sample date", "")),
+        **numeric_values(value, ref_low, ref_high),
+    }
+
+
+def parse_result_chunk(reader, size: int) -> List[Dict[str, Any]]:
+    """The next (up to) size valid rows from a results CSV reader; empty at the end of the file."""
+    chunk = []
+    for row in reader:
+        parsed = parse_result_row(row)
+        if parsed:
+            chunk.append(parsed)
+            if len(chunk) >= size:
+                break
+    return chunk
+
+
+def insert_results(db: Session, rows: List[Dict[str, Any]]):
+    """Store a chunk of parsed results and add them to the per-test summary, in the caller's transaction."""
+    db.execute(insert(Results), rows)
+    for stmt in results_analytics.summary_upserts(rows):
+        db.execute(stmt)
+
+
+async def insert_results_async(db: AsyncSession, rows: List[Dict[str, Any]]):
+    await db.execute(insert(Results), rows)
+    for stmt in results_analytics.summary_upserts(rows):
+        await db.execute(stmt)
 
 
 @app.post("/upload-results/")
 async def upload_results(
     patient_id: int = Form(...),  
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    include_results: bool = Form(True),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Upload a CSV of test results for a specific patient."""
+    """Upload a CSV of test results for a specific patient.
 
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    The file is parsed a line at a time and inserted in chunks, so memory stays
+    flat however large it is. Pass include_results=false to leave the parsed
+    rows out of the response too. Each chunk is read and parsed in the
+    threadpool (the upload may have spilled to disk) and inserted without
+    blocking, so other requests keep the event loop throughout.
+    """
+
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    contents = await file.read()
-    decoded = contents.decode("utf-8-sig").strip()
-    if not decoded:
-        raise HTTPException(status_code=400, detail="Empty file uploaded")
-
-    reader = csv.DictReader(io.StringIO(decoded))
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
     batch_id = str(uuid.uuid4())
     inserted = 0
+    results = []
 
-    for row in reader:
-        row = {k.strip().lower(): v.strip() for k, v in row.items() if k}
-
-        test_name = row.get("test name") or row.get("test") or ""
-        value = row.get("result") or row.get("value") or ""
-        unit = row.get("units", "")
-        flag = row.get("flag", "")
-        ref = row.get("reference range", "")
-
-        if not test_name or not value:
-            continue
+    try:
+        if not await run_in_threadpool(lambda: reader.fieldnames):
+            raise HTTPException(status_code=400, detail="Empty file uploaded")
 
-        ref_low, ref_high = None, None
-        if "-" in ref:
-            parts = [p.strip() for p in ref.split("-", 1)]
-            if len(parts) == 2:
-                ref_low, ref_high = parts
-
-        result = Results(
-            patient_id=patient_id,
-            test_name=test_name,
-            value=value,
-            unit=unit,
-            flag=flag,
-            reference_low=ref_low,
-            reference_high=ref_high,
-            source_file=file.filename,
-            batch_id=batch_id,
-        )
-        db.add(result)
-        inserted += 1
+        while True:
+            chunk = await run_in_threadpool(parse_result_chunk, reader, RESULTS_CHUNK_SIZE)
+            if not chunk:
+                break
 
-    db.commit()
+            for parsed in chunk:
+                parsed.update(source_file=file.filename, batch_id=batch_id)
+            if include_results:
+                results.extend(chunk)
 
-    results = db.query(Results).filter(
-        Results.patient_id == patient_id,
-        Results.batch_id == batch_id
-    ).all()
+            await insert_results_async(db, [{"patient_id": patient_id, **parsed} for parsed in chunk])
+            inserted += len(chunk)
+    except UnicodeDecodeError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="File is not valid UTF-8 text")
+    finally:
+        text.detach()
 
-    if not results:
+    if not inserted:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="No valid result rows found in CSV")
 
+    await db.commit()
+
     return {
         "status": "success",
         "batch_id": batch_id,
+        "inserted": inserted,
         "patient": {
             "id": patient.id,
             "name": patient.name,
@@ -167,41 +371,516 @@ async def upload_results(
             "address": patient.address,
             "conditions": patient.conditions,
         },
-        "results": [
-            {
-                "test_name": r.test_name,
-                "value": r.value,
-                "unit": r.unit,
-                "flag": r.flag,
-                "reference_low": r.reference_low,
-                "reference_high": r.reference_high,
-                "source_file": r.source_file,
-                "batch_id": r.batch_id,
-            }
-            for r in results
-        ],
+        "results": results,
     
     }
 
+LAB_EXPORT_COLUMNS = [
+    "Patient ID", "Patient Name", "Date of Birth", "Sex", "Sample Date",
+    "Test Name", "Result", "Units", "Reference Range", "Flag",
+]
+
+
+def age_on(date_of_birth: date, on: date) -> int:
+    return on.year - date_of_birth.year - ((on.month, on.day) < (date_of_birth.month, date_of_birth.day))
+
+
+@app.post("/upload-results/bulk")
+def upload_lab_export(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """Import a full lab export covering many patients.
+
+    Rows are matched to patients by lab patient code, then by name and date of
+    birth, using an index loaded once per import; unknown patients are created.
+    Each patient's rows are stored as their own results batch.
+    """
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+
+    # One projected query builds the lookup index for the whole import
+    by_code, by_name_dob = {}, {}
+    for row in db.query(Patient.id, Patient.patient_code, Patient.name, Patient.date_of_birth):
+        if row.patient_code:
+            by_code[row.patient_code] = row.id
+        if row.date_of_birth:
+            by_name_dob[(row.name.lower(), row.date_of_birth)] = row.id
+
+    patients = {}
+    chunk = []
+    inserted = skipped = 0
+
+    def resolve(row: Dict[str, str]):
+        code = row.get("patient id", "")
+        name = row.get("patient name", "")
+        dob = parse_date(row.get("date of birth", ""))
+
+        patient_id = by_code.get(code) if code else None
+        if patient_id is None and name and dob:
+            patient_id = by_name_dob.get((name.lower(), dob))
+            if patient_id is not None and code:
+                db.query(Patient).filter(Patient.id == patient_id).update({"patient_code": code})
+                by_code[code] = patient_id
+
+        created = False
+        if patient_id is None:
+            if not name:
+                return None
+            sex = row.get("sex", "").upper()[:1]
+            patient = Patient(
+                name=name,
+                age=age_on(dob, parse_date(row.get("sample date", "")) or date.today()) if dob else None,
+                sex=sex if sex in ("M", "F") else "Other",
+                patient_code=code or None,
+                date_of_birth=dob,
+            )
+            db.add(patient)
+            db.flush()
+            patient_id = patient.id
+            created = True
+            if code:
+                by_code[code] = patient_id
+            if dob:
+                by_name_dob[(name.lower(), dob)] = patient_id
+
+        if patient_id not in patients:
+            patients[patient_id] = {
+                "patient_id": patient_id,
+                "patient_code": code or None,
+                "name": name,
+                "created": created,
+                "batch_id": str(uuid.uuid4()),
+                "results": 0,
+            }
+        return patients[patient_id]
+
+    try:
+        first = next(reader, None)
+        if not first:
+            raise HTTPException(status_code=400, detail="Empty file uploaded")
+
+        # Lab extracts may or may not carry a header row
+        header = [h.strip() for h in first]
+        if "test name" in (h.lower() for h in header):
+            columns = header
+            pending = []
+        else:
+            columns = LAB_EXPORT_COLUMNS
+            pending = [first]
+
+        for values in (*pending, *reader):
+            row = {k.strip().lower(): (v or "").strip() for k, v in zip(columns, values)}
+            parsed = parse_result_row(row)
+            summary = resolve(row) if parsed else None
+            if not summary:
+                skipped += 1
+                continue
+
+            parsed.update(source_file=file.filename, batch_id=summary["batch_id"])
+            chunk.append({"patient_id": summary["patient_id"], **parsed})
+            summary["results"] += 1
+
+            if len(chunk) >= RESULTS_CHUNK_SIZE:
+                insert_results(db, chunk)
+                inserted += len(chunk)
+                chunk = []
+
+        if chunk:
+            insert_results(db, chunk)
+            inserted += len(chunk)
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="File is not valid UTF-8 text")
+    finally:
+        text.detach()
+
+    if not inserted:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="No valid result rows found in CSV")
+
+    db.commit()
+
+    return {
+        "status": "success",
+        "inserted": inserted,
+        "skipped": skipped,
+        "created_patients": sum(1 for p in patients.values() if p["created"]),
+        "patients": list(patients.values()),
+    }
+
+
+ABNORMAL_PAGE_MAX = 500
+ABNORMAL_DIRECTIONS = {"low": [BELOW], "high": [ABOVE], None: [BELOW, ABOVE]}
+
+
+@app.get("/results/abnormal")
+def list_abnormal_results(
+    response: Response,
+    test_name: str = None,
+    direction: str = None,
+    below: float = None,
+    above: float = None,
+    patient_id: int = None,
+    limit: int = 100,
+    after_id: int = 0,
+    db: Session = Depends(get_db)
+):
+    """Results outside their reference range, in id order, a page at a time.
+
+    direction is "low" or "high" (default both); below/above narrow by value,
+    e.g. test_name=Haemoglobin&direction=low&below=100. Filtering runs on the
+    numeric columns parsed at upload. The X-Next-After-Id response header is
+    the after_id for the next page.
+    """
+    if direction not in ABNORMAL_DIRECTIONS:
+        raise HTTPException(status_code=400, detail="direction must be 'low' or 'high'")
+    limit = max(1, min(limit, ABNORMAL_PAGE_MAX))
+
+    query = (
+        select(
+            Results.id, Results.patient_id, Patient.name.label("patient_name"), Results.test_name,
+            Results.value, Results.unit, Results.value_num, Results.ref_low_num, Results.ref_high_num,
+            Results.out_of_range, Results.flag, Results.sample_date,
+        )
+        .outerjoin(Patient, Patient.id == Results.patient_id)
+        .where(Results.out_of_range.in_(ABNORMAL_DIRECTIONS[direction]), Results.id > after_id)
+    )
+    if test_name:
+        query = query.where(Results.test_name == test_name)
+    if patient_id:
+        query = query.where(Results.patient_id == patient_id)
+    if below is not None:
+        query = query.where(Results.value_num < below)
+    if above is not None:
+        query = query.where(Results.value_num > above)
+
+    rows = db.execute(query.order_by(Results.id).limit(limit + 1)).mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-After-Id"] = str(rows[-1]["id"])
+
+    return [dict(row) for row in rows]
+
+
+@app.get("/results/series")
+def result_series(patient_id: int, test_name: str, db: Session = Depends(get_db)):
+    """A patient's results for one test over time, as parallel arrays, with min/max/mean and trend."""
+    return results_analytics.patient_series(db, patient_id, test_name)
+
+
+@app.get("/results/percentiles")
+def result_percentiles(
+    test_name: str,
+    percentiles: str = "5,25,50,75,95",
+    unit: str = None,
+    sex: str = None,
+    age_min: int = None,
+    age_max: int = None,
+    latest_only: bool = False,
+    bins: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Distribution of a test's values across the cohort: percentiles, mean/std and a histogram.
+
+    latest_only counts each patient once, by their most recent result.
+    """
+    try:
+        points = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    if not points or any(not 0 <= p <= 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    return results_analytics.cohort_percentiles(
+        db, test_name, points, unit=unit, sex=sex, age_min=age_min, age_max=age_max,
+        latest_only=latest_only, bins=max(1, min(bins, 100)),
+    )
+
+
+@app.get("/results/abnormal-rates")
+def result_abnormal_rates(test_name: str = None, min_results: int = 1, db: Session = Depends(get_db)):
+    """Share of results below and above their reference range per test, most often abnormal first.
+
+    Read from the summary table kept up to date by each upload, so it doesn't scan results.
+    """
+    return results_analytics.abnormal_rates(db, test_name=test_name, min_results=max(1, min_results))
+
+
+def letter_summary(l: LetterSummary) -> Dict[str, Any]:
+    return {
+        "id": l.letter_uid,
+        "patientId": f"PT-{l.patient_id:04d}",
+        "patientName": l.patient_name,
+        "doctorName": l.doctor_name,
+        "status": l.status,
+        "details": l.details,
+        "time": l.created_at.strftime("%H:%M"),
+        "date": l.created_at.strftime("%Y-%m-%d"),
+        "approvedAt": l.approved_at.strftime("%H:%M") if l.approved_at else None
+    }
+
+
+def letter_detail(l: LetterDetail) -> Dict[str, Any]:
+    return {
+        "letterUid": l.letter_uid,
+        "patientId": l.patient_id,
+        "patientName": l.patient_name or "Unknown",
+        "doctorName": l.doctor_name or "Unknown",
+        "details": l.details or "",
+        "status": l.status,
+        "content": l.content or "",
+        "createdAt": l.created_at.strftime("%Y-%m-%d %H:%M") if l.created_at else "",
+        "approvedAt": l.approved_at.strftime("%Y-%m-%d %H:%M") if l.approved_at else None,
+        "filePath": l.file_path,
+        "version": l.version,
+        "contentVersion": l.content_version,
+    }
+
+
+def letters_changed(event: str, letters: List[LetterSummary]):
+    """Call after committing letter changes: invalidates listing ETags and notifies /letters/events."""
+    letters_version.bump()
+    for letter in letters:
+        letter_events.publish(event, {**letter_summary(letter), "version": letter.version})
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
 @app.get("/letters/recent")
-def get_recent_letters(db: Session = Depends(get_db)):
-    letters = db.query(Letter).order_by(Letter.created_at.desc()).limit(10).all()
-    return [
-        {
-            "id": l.letter_uid,
-            "patientId": f"PT-{l.patient_id:04d}",
-            "doctorName": l.doctor_name,
-            "status": l.status,
-            "details": l.details,
-            "time": l.created_at.strftime("%H:%M"),
-            "date": l.created_at.strftime("%Y-%m-%d"),
-            "approvedAt": l.approved_at.strftime("%H:%M") if l.approved_at else None
-        }
-        for l in letters
-    ]
+async def get_recent_letters(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    etag = letters_version.etag("recent")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    letters = await letter_store.recent_letters_async(db, limit=10)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return [letter_summary(l) for l in letters]
+
+
+LETTERS_PAGE_MAX = 100
+LETTERS_COUNT_CAP = 10000
+
+
+def encode_cursor(letter: LetterSummary) -> str:
+    raw = f"{letter.created_at.isoformat()}|{letter.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, letter_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(letter_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def filter_letters(query, status=None, doctor=None, patient_id=None, date_from=None, date_to=None):
+    if status:
+        query = query.filter(Letter.status == status)
+    if doctor:
+        query = query.filter(Letter.doctor_name == doctor)
+    if patient_id:
+        query = query.filter(Letter.patient_id == patient_id)
+    if date_from:
+        query = query.filter(Letter.created_at >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(Letter.created_at < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return query
+
+
+@app.get("/letters")
+def list_letters(
+    request: Request,
+    response: Response,
+    limit: int = 20,
+    cursor: str = None,
+    status: str = None,
+    doctor: str = None,
+    patient_id: int = None,
+    date_from: date = None,
+    date_to: date = None,
+    db: Session = Depends(get_db)
+):
+    """Browse letters newest first, a page at a time.
+
+    Pass the returned nextCursor back as cursor to get the following page.
+    Pages are found by seeking the (created_at, id) index, so a page deep into
+    the history costs the same as the first one.
+    """
+    etag = letters_version.etag(hashlib.sha256(request.url.query.encode()).hexdigest()[:16])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    limit = max(1, min(limit, LETTERS_PAGE_MAX))
+
+    query = filter_letters(db.query(Letter), status, doctor, patient_id, date_from, date_to)
+
+    # Counting stops at LETTERS_COUNT_CAP, so a huge table doesn't make every page slow
+    counted = db.query(func.count()).select_from(
+        query.with_entities(Letter.id).limit(LETTERS_COUNT_CAP + 1).subquery()
+    ).scalar()
+
+    page = filter_letters(letter_store.summary_query(), status, doctor, patient_id, date_from, date_to)
+    if cursor:
+        page = page.filter(tuple_(Letter.created_at, Letter.id) < decode_cursor(cursor))
+
+    rows = db.execute(page.order_by(Letter.created_at.desc(), Letter.id.desc()).limit(limit + 1))
+    letters = [letter_store.to_summary(row) for row in rows]
+    has_more = len(letters) > limit
+    letters = letters[:limit]
+
+    return {
+        "letters": [letter_summary(l) for l in letters],
+        "nextCursor": encode_cursor(letters[-1]) if has_more else None,
+        "total": min(counted, LETTERS_COUNT_CAP),
+        "totalIsEstimate": counted > LETTERS_COUNT_CAP,
+    }
+
+EXPORT_FETCH_SIZE = 100
+
+
+class ZipStream:
+    """Write-only sink for zipfile; the export drains it after each letter is added."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_rows(filters: Dict[str, Any], after=None):
+    """Next EXPORT_FETCH_SIZE letters to export, with their patient name, newest first."""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            Letter.id, Letter.letter_uid, Letter.created_at, Letter.content, Letter.doctor_name, Patient.name
+        ).outerjoin(Patient, Patient.id == Letter.patient_id)
+        query = filter_letters(query, **filters)
+        if after:
+            query = query.filter(tuple_(Letter.created_at, Letter.id) < after)
+        return query.order_by(Letter.created_at.desc(), Letter.id.desc()).limit(EXPORT_FETCH_SIZE).all()
+    finally:
+        db.close()
+
+
+@app.get("/letters/export")
+def export_letters(
+    status: str = None,
+    doctor: str = None,
+    patient_id: int = None,
+    date_from: date = None,
+    date_to: date = None,
+):
+    """Download every matching letter as PDFs in one ZIP.
+
+    Letters are rendered a few at a time in the PDF process pool and each one is
+    written to the response as soon as it is ready, so memory stays bounded
+    however many letters match.
+    """
+    filters = dict(status=status, doctor=doctor, patient_id=patient_id, date_from=date_from, date_to=date_to)
+    date_str = datetime.now().strftime("%B %d, %Y")
+    window = pdf_pool.workers * 2
+
+    async def render(row) -> bytes:
+        patient_name = row.name or "Unknown"
+        content = row.content or "No content available"
+        doctor_name = row.doctor_name or 'Unknown'
+        content_hash = pdf_content_hash(patient_name, content, doctor_name, date_str)
+
+        cached = pdf_cache.get(row.letter_uid)
+        if cached and cached[0] == content_hash:
+            return cached[1]
+        return await pdf_pool.render(patient_name, content, doctor_name, date_str, wait=True)
+
+    async def archive():
+        await run_in_threadpool(letter_edits.flush_all)
+        sink = ZipStream()
+        pending = deque()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+            after = None
+            while True:
+                rows = await run_in_threadpool(export_rows, filters, after)
+                for row in rows:
+                    pending.append((row.letter_uid, asyncio.ensure_future(render(row))))
+                    # Keep only a window of renders in flight, writing out the oldest first
+                    while len(pending) >= window:
+                        letter_uid, task = pending.popleft()
+                        zf.writestr(f"letter_{letter_uid}.pdf", await task)
+                        yield sink.drain()
+                if len(rows) < EXPORT_FETCH_SIZE:
+                    break
+                after = (rows[-1].created_at, rows[-1].id)
+
+            while pending:
+                letter_uid, task = pending.popleft()
+                zf.writestr(f"letter_{letter_uid}.pdf", await task)
+                yield sink.drain()
+        yield sink.drain()
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="letters_{date.today():%Y%m%d}.zip"'},
+    )
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/letters/events")
+async def letter_event_stream(request: Request):
+    """Server-sent events for letter changes, so the dashboard doesn't have to poll.
+
+    Events are "created", "status" and "content", each carrying the same
+    summary as /letters/recent plus the letter version. "resync" means events
+    were dropped and the client should refetch.
+    """
+    queue = letter_events.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), LETTER_EVENTS_PING)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies and the browser from timing out the connection
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                event_id, event, data = message
+                yield f"id: {event_id}\n" + sse_event(event, data)
+        finally:
+            letter_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 from pydantic import BaseModel
-from datetime import datetime
 
 class StatusUpdate(BaseModel):
     new_status: str
@@ -212,7 +891,8 @@ def update_letter_status(
     body: StatusUpdate,
     db: Session = Depends(get_db)
 ):
-    letter = db.query(Letter).filter(Letter.letter_uid == letter_uid).first()
+    flush_letter_edits(letter_uid)
+    letter, patient_name = letter_store.get_letter_for_update(db, letter_uid)
     if not letter:
         raise HTTPException(status_code=404, detail="Letter not found")
 
@@ -223,43 +903,39 @@ def update_letter_status(
 
     letter.status = new_status
     letter.approved_at = datetime.utcnow() if new_status == "Approved" else None
-
-    db.add(letter)
+    letter.version = (letter.version or 1) + 1
+    # Snapshot before committing, so nothing needs reloading afterwards
+    updated = letter_store.from_letter(letter, patient_name)
     db.commit()
-    db.refresh(letter)
+    pdf_cache.invalidate(letter_uid)
+    letters_changed("status", [updated])
 
     return {
-        "id": letter.letter_uid,
-        "status": letter.status,
+        "id": updated.letter_uid,
+        "status": updated.status,
         "approvedAt": (
-            letter.approved_at.strftime("%Y-%m-%d %H:%M")
-            if letter.approved_at else None
+            updated.approved_at.strftime("%Y-%m-%d %H:%M")
+            if updated.approved_at else None
         ),
     }
 
 
 @app.get("/letters/{letter_uid}")
-def get_letter(letter_uid: str, db: Session = Depends(get_db)):
+async def get_letter(letter_uid: str, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     """Get a specific letter by its UID"""
-    letter = db.query(Letter).filter(Letter.letter_uid == letter_uid).first()
+    if letter_edits.has_pending(letter_uid):
+        await run_in_threadpool(flush_letter_edits, letter_uid)
+
+    letter = await letter_store.get_letter_async(db, letter_uid)
     if not letter:
         raise HTTPException(status_code=404, detail="Letter not found")
-    
-    # Get patient information
-    patient = db.query(Patient).filter(Patient.id == letter.patient_id).first()
-    
-    return {
-        "letterUid": letter.letter_uid,
-        "patientId": letter.patient_id,
-        "patientName": patient.name if patient else "Unknown",
-        "doctorName": letter.doctor_name or "Unknown",
-        "details": letter.details or "",
-        "status": letter.status,
-        "content": letter.content or "",
-        "createdAt": letter.created_at.strftime("%Y-%m-%d %H:%M") if letter.created_at else "",
-        "approvedAt": letter.approved_at.strftime("%Y-%m-%d %H:%M") if letter.approved_at else None,
-        "filePath": letter.file_path
-    }
+
+    etag = f'W/"{letter_uid}-{letter.version}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return letter_detail(letter)
 
 
 class ContentUpdate(BaseModel):
@@ -271,169 +947,558 @@ def update_letter_content(
     body: ContentUpdate,
     db: Session = Depends(get_db)
 ):
-    """Update the content of a letter"""
-    letter = db.query(Letter).filter(Letter.letter_uid == letter_uid).first()
+    """Replace the whole content of a letter. See PATCH for sending just the changes."""
+    flush_letter_edits(letter_uid)
+    letter, patient_name = letter_store.get_letter_for_update(db, letter_uid)
     if not letter:
         raise HTTPException(status_code=404, detail="Letter not found")
     
     letter.content = body.content
-    db.add(letter)
+    letter.version = (letter.version or 1) + 1
+    letter.content_version = (letter.content_version or 1) + 1
+    updated = letter_store.from_letter(letter, patient_name)
     db.commit()
-    db.refresh(letter)
-    
-    # Get patient information
-    patient = db.query(Patient).filter(Patient.id == letter.patient_id).first()
-    
-    return {
-        "letterUid": letter.letter_uid,
-        "patientId": letter.patient_id,
-        "patientName": patient.name if patient else "Unknown",
-        "doctorName": letter.doctor_name or "Unknown",
-        "details": letter.details or "",
-        "status": letter.status,
-        "content": letter.content or "",
-        "createdAt": letter.created_at.strftime("%Y-%m-%d %H:%M") if letter.created_at else "",
-        "approvedAt": letter.approved_at.strftime("%Y-%m-%d %H:%M") if letter.approved_at else None,
-    }
+    letter_content_saved(updated)
 
+    return letter_detail(updated)
 
-from fastapi.responses import FileResponse, StreamingResponse
-from reportlab.lib.pagesizes import letter as letter_size
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
-import tempfile
 
-@app.get("/letters/{letter_uid}/pdf")
-def download_letter_pdf(letter_uid: str, db: Session = Depends(get_db)):
-    """Generate and download a PDF of the letter"""
-    letter_obj = db.query(Letter).filter(Letter.letter_uid == letter_uid).first()
-    if not letter_obj:
-        raise HTTPException(status_code=404, detail="Letter not found")
-    
-    patient = db.query(Patient).filter(Patient.id == letter_obj.patient_id).first()
-    patient_name = patient.name if patient else "Unknown"
-    
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    temp_path = temp_file.name
-    temp_file.close()
-    
-    try:
-        # Create PDF
-        doc = SimpleDocTemplate(temp_path, pagesize=letter_size)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Custom styles
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor='#003366',
-            spaceAfter=12
+def letter_content_saved(letter: LetterSummary):
+    """Call once new letter content is committed."""
+    pdf_cache.invalidate(letter.letter_uid)
+    letter_page_cache.invalidate(letter.letter_uid)
+    letters_changed("content", [letter])
+
+
+# Autosave patches are held here and written in one commit per burst of typing
+letter_edits = LetterEditBuffer(
+    SessionLocal, letter_content_saved, delay=LETTER_EDIT_DELAY, max_delay=LETTER_EDIT_MAX_DELAY
+)
+
+
+def flush_letter_edits(letter_uid: str):
+    """Write a letter's buffered edits before it's read or changed.
+
+    Raises 503 while they can't be saved, rather than serving or overwriting
+    text older than what PATCH has already accepted.
+    """
+    if not letter_edits.flush(letter_uid):
+        raise HTTPException(
+            status_code=503,
+            detail="Letter edits could not be saved yet, please retry shortly",
+            headers={"Retry-After": str(LETTER_EDIT_RETRY_AFTER)},
         )
-        
-        address_style = ParagraphStyle(
-            'Address',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor='#666666',
-            spaceAfter=20
+
+
+class TextEdit(BaseModel):
+    start: int
+    end: int
+    text: str = ""
+
+
+class ContentPatch(BaseModel):
+    base_version: int
+    edits: List[TextEdit]
+
+
+@app.patch("/letters/{letter_uid}/content")
+def patch_letter_content(letter_uid: str, body: ContentPatch, db: Session = Depends(get_db)):
+    """Apply text edits made against base_version (the letter's contentVersion).
+
+    Each edit replaces content[start:end] with text (offsets in UTF-16 code
+    units, as in JavaScript), applied in order. Returns 409 with the current
+    contentVersion if the text has changed since base_version; status changes
+    don't count. The change is written to the database after a short pause in
+    edits rather than on every request.
+    """
+    try:
+        version = letter_edits.patch(
+            db, letter_uid, body.base_version, [(e.start, e.end, e.text) for e in body.edits]
         )
-        
-        body_style = ParagraphStyle(
-            'Body',
-            parent=styles['Normal'],
-            fontSize=11,
-            leading=16,
-            spaceAfter=12
+    except EditConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Letter has changed since base_version", "contentVersion": e.version},
         )
-        
-        # Add letterhead
-        story.append(Paragraph("NHS", header_style))
-        story.append(Paragraph("Computer Science Building<br /> Jubilee Campus<br /> University of Nottingham<br />", address_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Add date
-        date_str = datetime.now().strftime("%B %d, %Y")
-        story.append(Paragraph(date_str, styles['Normal']))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Add recipient
-        story.append(Paragraph(f"Dear {patient_name},", styles['Normal']))
-        story.append(Spacer(1, 0.2*inch))
-        
-        content = letter_obj.content or "No content available"
-        paragraphs = content.split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                para_html = para.replace('\n', '<br/>')
-                story.append(Paragraph(para_html, body_style))
-        
-        story.append(Spacer(1, 0.4*inch))
-        
-        story.append(Paragraph("Sincerely,", styles['Normal']))
-        story.append(Spacer(1, 0.1*inch))
-        story.append(Paragraph(f"<b>{letter_obj.doctor_name or 'Unknown'}</b>", styles['Normal']))
-        story.append(Paragraph("<i>NHS Medical Professional</i>", address_style))
-        
-        doc.build(story)
-        
-        return FileResponse(
-            temp_path,
-            media_type="application/pdf",
-            filename=f"letter_{letter_uid}.pdf"
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if version is None:
+        raise HTTPException(status_code=404, detail="Letter not found")
+    return {"letterUid": letter_uid, "contentVersion": version}
+
+
+from fastapi.responses import StreamingResponse, HTMLResponse
+
+pdf_pool = PdfRenderPool(workers=PDF_WORKERS)
+
+# Cached PDFs are (content hash, pdf bytes) keyed by letter uid
+pdf_cache = SizedLRUCache(max_bytes=PDF_CACHE_BYTES, sizeof=lambda entry: len(entry[1]))
+
+
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+letter_page_cache = SizedLRUCache(max_bytes=LETTER_PAGE_CACHE_BYTES)
+
+
+@app.get("/letters/{letter_uid}/view", response_class=HTMLResponse)
+def view_letter(letter_uid: str, db: Session = Depends(get_db)):
+    """The letter's editable HTML page, rendered from the database so it always shows the latest content."""
+    flush_letter_edits(letter_uid)
+    page = letter_page_cache.get(letter_uid)
+    if page is None:
+        letter = letter_store.get_letter(db, letter_uid)
+        if not letter:
+            raise HTTPException(status_code=404, detail="Letter not found")
+
+        page = render_letter_html(
+            letter.letter_uid,
+            letter.patient_name or "Unknown",
+            letter.content or "",
+            letter.doctor_name or "Unknown",
+            (letter.created_at or datetime.utcnow()).strftime("%B %d, %Y"),
+        ).encode("utf-8")
+        letter_page_cache.put(letter_uid, page)
+
+    return HTMLResponse(content=page)
+
+
+def pdf_content_hash(patient_name: str, content: str, doctor_name: str, date_str: str) -> str:
+    # Everything printed on the page; a change to any of it means a re-render
+    return hashlib.sha256(
+        json.dumps([patient_name, content, doctor_name, date_str]).encode("utf-8")
+    ).hexdigest()
+
+
+def letter_pdf_fields(letter_uid: str):
+    """Patient name, content and doctor for a letter's PDF, or None if it doesn't exist."""
+    flush_letter_edits(letter_uid)
+    db = SessionLocal()
+    try:
+        letter = letter_store.get_letter(db, letter_uid)
+        if not letter:
+            return None
+        return (
+            letter.patient_name or "Unknown",
+            letter.content or "No content available",
+            letter.doctor_name or 'Unknown',
         )
-    except Exception as e:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
-        raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
+    finally:
+        db.close()
 
 
-@app.post("/letters/generate")
-def generate_letter(letter_data: Dict[str, Any] = Body(..., embed=True),
-                    db: Session = Depends(get_db)):
-    
+@app.get("/letters/{letter_uid}/pdf")
+async def download_letter_pdf(letter_uid: str, request: Request):
+    """Generate and download a PDF of the letter.
+
+    The PDF is rendered in memory and streamed back with its length and an ETag,
+    so a client that already has this version gets a 304 without any rendering.
+    Rendering runs in the PDF process pool; when that is full the request gets
+    a 503 with Retry-After instead of queueing indefinitely.
+    """
+    fields = await run_in_threadpool(letter_pdf_fields, letter_uid)
+    if not fields:
+        raise HTTPException(status_code=404, detail="Letter not found")
+
+    patient_name, content, doctor_name = fields
+    date_str = datetime.now().strftime("%B %d, %Y")
+
+    content_hash = pdf_content_hash(patient_name, content, doctor_name, date_str)
+    etag = f'"{content_hash[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = pdf_cache.get(letter_uid)
+    if cached and cached[0] == content_hash:
+        pdf = cached[1]
+    else:
+        try:
+            pdf = await pdf_pool.render(patient_name, content, doctor_name, date_str)
+        except PdfPoolBusy:
+            raise HTTPException(
+                status_code=503,
+                detail="PDF renderer is busy, please retry shortly",
+                headers={"Retry-After": str(PDF_RETRY_AFTER)},
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
+        pdf_cache.put(letter_uid, (content_hash, pdf))
+
+    def chunks():
+        view = memoryview(pdf)
+        for start in range(0, len(view), PDF_CHUNK_SIZE):
+            yield bytes(view[start:start + PDF_CHUNK_SIZE])
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/pdf",
+        headers={
+            **headers,
+            "Content-Length": str(len(pdf)),
+            "Content-Disposition": f'attachment; filename="letter_{letter_uid}.pdf"',
+        },
+    )
+
+
+def render_letter(letter_data: Dict[str, Any], letter_content: str) -> Letter:
+    """Build the (not yet saved) Letter row, writing its HTML file when letters are stored as files."""
     patient_name = letter_data.get("patient", {}).get("name", "Unknown")
     patient_id = letter_data.get("patient", {}).get("id")
     doctor_name = letter_data.get("doctor", {}).get("name", "Dr. Smith")
     details = letter_data.get("details", "")
-    
-    if patient_id:
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-    else:
-        raise HTTPException(status_code=400, detail="Patient ID is required")
-    
-    letter_content = generate_letter_content(letter_data, llama_model="llama3")
-    
-    result = create_pdf(patient_name, letter_content, doctor_name)
-    
-   
-    new_letter = Letter(
+
+    with letter_stage_seconds.time(stage="render"):
+        if LETTER_STORAGE == "files":
+            result = create_pdf(patient_name, letter_content, doctor_name)
+            letter_uid, file_path = result["letter_uid"], result["file_path"]
+        else:
+            # Nothing is written; the page is rendered from the database by /letters/{uid}/view
+            letter_uid, file_path = new_letter_uid(), None
+
+    return Letter(
         patient_id=patient_id,
         doctor_name=doctor_name,
         details=details,
         status="Draft",
-        letter_uid=result["letter_uid"],
+        letter_uid=letter_uid,
         content=letter_content,
-        file_path=result["file_path"]
+        file_path=file_path
     )
-    
-    db.add(new_letter)
-    db.commit()
-    db.refresh(new_letter)
-    
+
+
+def letter_result(letter: Letter) -> Dict[str, Any]:
     return {
         "status": "success",
-        "letter_uid": new_letter.letter_uid,
-        "file_path": new_letter.file_path,
-        "pdf_url": new_letter.file_path,
-        "html_url": f"/static/{new_letter.file_path}",
-        "letter_id": new_letter.id
+        "letter_uid": letter.letter_uid,
+        "file_path": letter.file_path,
+        "pdf_url": letter.file_path,
+        "html_url": f"/static/{letter.file_path}" if letter.file_path else f"/letters/{letter.letter_uid}/view",
+        "letter_id": letter.id
     }
 
 
+def save_letter(db: Session, letter_data: Dict[str, Any], letter_content: str) -> Dict[str, Any]:
+    """Render the letter HTML and store the Letter row."""
+    new_letter = render_letter(letter_data, letter_content)
+
+    with letter_stage_seconds.time(stage="db_commit"):
+        db.add(new_letter)
+        # Flushing fills in the id and defaults; read them before the commit expires the row
+        db.flush()
+        result = letter_result(new_letter)
+        saved = letter_store.from_letter(new_letter, letter_data.get("patient", {}).get("name"))
+        db.commit()
+    letters_changed("created", [saved])
+
+    return result
+
+
+# Served at /metrics for Prometheus to scrape
+app_metrics = Registry()
+letter_stage_seconds = app_metrics.histogram(
+    "nhscribe_letter_stage_seconds",
+    "Time spent in each stage of building a letter",
+    ["stage"],
+)
+letter_build_seconds = app_metrics.histogram(
+    "nhscribe_letter_build_seconds", "End-to-end time for a letter job, from patient lookup to commit", ["outcome"]
+)
+letter_cache_lookups = app_metrics.counter(
+    "nhscribe_letter_cache_lookups_total", "Letter content cache lookups", ["result"]
+)
+llm_requests = app_metrics.counter("nhscribe_llm_requests_total", "Completed Ollama generate calls", ["model"])
+llm_prompt_tokens = app_metrics.counter(
+    "nhscribe_llm_prompt_tokens_total", "Prompt tokens evaluated by Ollama", ["model"]
+)
+llm_eval_tokens = app_metrics.counter("nhscribe_llm_eval_tokens_total", "Tokens generated by Ollama", ["model"])
+llm_tokens_per_second = app_metrics.histogram(
+    "nhscribe_llm_tokens_per_second",
+    "Generation speed of each Ollama call (eval tokens / eval duration)",
+    ["model"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200),
+)
+llm_duration_seconds = app_metrics.histogram(
+    "nhscribe_llm_duration_seconds",
+    "Ollama-reported time per call: model load, prompt evaluation, generation and total",
+    ["model", "phase"],
+)
+
+
+def record_llm_stats(stats: Dict[str, Any]):
+    """on_stats callback for the letter generators."""
+    llm_requests.inc(model=LLAMA_MODEL)
+    llm_prompt_tokens.inc(stats["prompt_tokens"] or 0, model=LLAMA_MODEL)
+    llm_eval_tokens.inc(stats["eval_tokens"] or 0, model=LLAMA_MODEL)
+    if stats["tokens_per_second"] is not None:
+        llm_tokens_per_second.observe(stats["tokens_per_second"], model=LLAMA_MODEL)
+    for phase in ("load", "prompt_eval", "eval", "total"):
+        if stats[f"{phase}_seconds"] is not None:
+            llm_duration_seconds.observe(stats[f"{phase}_seconds"], model=LLAMA_MODEL, phase=phase)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(app_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+letter_cache = LetterCache(SessionLocal, max_entries=LETTER_CACHE_SIZE)
+
+
+def letter_content_for(letter_data: Dict[str, Any]) -> str:
+    """Letter body from the cache, or from the LLM when missing or "bypass_cache" is set."""
+    key = cache_key(letter_data, LLAMA_MODEL)
+    if not letter_data.get("bypass_cache"):
+        with letter_stage_seconds.time(stage="cache_lookup"):
+            cached = letter_cache.get(key)
+        letter_cache_lookups.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+    with letter_stage_seconds.time(stage="llm"):
+        letter_content = generate_letter_content(letter_data, llama_model=LLAMA_MODEL, on_stats=record_llm_stats)
+    with letter_stage_seconds.time(stage="cache_store"):
+        letter_cache.put(key, LLAMA_MODEL, letter_content)
+    return letter_content
+
+
+def build_letter(db: Session, letter_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate, render and store a letter. Runs on the letter job workers."""
+    patient_id = letter_data.get("patient", {}).get("id")
+
+    started, outcome = time.perf_counter(), "failed"
+    try:
+        with letter_stage_seconds.time(stage="patient_lookup"):
+            patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+
+        letter_content = letter_content_for(letter_data)
+
+        result = save_letter(db, letter_data, letter_content)
+        outcome = "success"
+        return result
+    finally:
+        letter_build_seconds.observe(time.perf_counter() - started, outcome=outcome)
+
+
+# Per-item lines of batch jobs still running, for /letters/generate/batch to stream
+batch_progress: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def build_letter_batch(db: Session, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate every letter in a batch and save them in one commit. Runs on the letter job workers."""
+    items = payload["batch_items"]
+    progress = batch_progress.setdefault(payload["batch_id"], [])
+    try:
+        # One lookup for every patient in the batch
+        patient_ids = {item.get("patient", {}).get("id") for item in items} - {None}
+        known_names = {
+            row.id: row.name
+            for row in db.query(Patient.id, Patient.name).filter(Patient.id.in_(patient_ids)).all()
+        }
+
+        def build(item: Dict[str, Any]) -> Letter:
+            patient_id = item.get("patient", {}).get("id")
+            if not patient_id:
+                raise ValueError("Patient ID is required")
+            if patient_id not in known_names:
+                raise ValueError("Patient not found")
+            return render_letter(item, letter_content_for(item))
+
+        built = {}
+        with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+            futures = {pool.submit(build, item): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    built[index] = future.result()
+                except Exception as e:
+                    progress.append({"index": index, "status": "failed", "error": str(e)})
+                else:
+                    progress.append({"index": index, "status": "generated", "letter_uid": built[index].letter_uid})
+
+        try:
+            with letter_stage_seconds.time(stage="db_commit"):
+                db.add_all(built.values())
+                db.flush()
+                letters = [{"index": index, **letter_result(letter)} for index, letter in sorted(built.items())]
+                saved = [
+                    letter_store.from_letter(letter, known_names.get(letter.patient_id))
+                    for _, letter in sorted(built.items())
+                ]
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            for letter in built.values():
+                if not letter.file_path:
+                    continue
+                file_path = os.path.join(LETTERS_DIR, letter.file_path)
+                if os.path.exists(file_path):
+                    os.unlink(file_path)
+            raise RuntimeError(f"Failed to save letters: {e}") from e
+        letters_changed("created", saved)
+
+        return {
+            "status": "success",
+            "total": len(items),
+            "generated": len(letters),
+            "failed": len(items) - len(letters),
+            "letters": letters,
+            "items": list(progress),
+        }
+    finally:
+        batch_progress.pop(payload["batch_id"], None)
+
+
+def run_letter_job(db: Session, payload: Dict[str, Any]) -> Dict[str, Any]:
+    if "batch_items" in payload:
+        return build_letter_batch(db, payload)
+    return build_letter(db, payload)
+
+
+letter_jobs = LetterJobQueue(SessionLocal, run_letter_job, workers=LETTER_WORKERS)
+
+
+@app.post("/letters/generate", status_code=202)
+def generate_letter(letter_data: Dict[str, Any] = Body(..., embed=True),
+                    db: Session = Depends(get_db)):
+    """Queue a letter for generation and return its job id straight away"""
+    patient_id = letter_data.get("patient", {}).get("id")
+
+    if patient_id:
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+    else:
+        raise HTTPException(status_code=400, detail="Patient ID is required")
+
+    job_id = letter_jobs.enqueue(letter_data)
+
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "job_url": f"/letters/jobs/{job_id}"
+    }
+
+
+@app.get("/letters/jobs/{job_id}")
+async def get_letter_job(job_id: str, wait: float = 0):
+    """Poll a letter job. Pass wait=<seconds> to block until it finishes (long-poll)."""
+    if wait > 0:
+        await letter_jobs.wait(job_id, timeout=min(wait, 60))
+
+    job = await run_in_threadpool(letter_jobs.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/letters/cache/stats")
+def get_letter_cache_stats():
+    return letter_cache.stats()
+
+
+@app.delete("/letters/cache")
+def clear_letter_cache():
+    return {"status": "success", "removed": letter_cache.clear()}
+
+
+@app.post("/letters/generate/stream")
+def generate_letter_stream(letter_data: Dict[str, Any] = Body(..., embed=True),
+                           db: Session = Depends(get_db)):
+    """Generate a letter as server-sent events: one 'token' event per chunk, then 'done'."""
+    patient_id = letter_data.get("patient", {}).get("id")
+
+    if patient_id:
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+    else:
+        raise HTTPException(status_code=400, detail="Patient ID is required")
+
+    def events():
+        key = cache_key(letter_data, LLAMA_MODEL)
+        try:
+            cached = None
+            if not letter_data.get("bypass_cache"):
+                with letter_stage_seconds.time(stage="cache_lookup"):
+                    cached = letter_cache.get(key)
+                letter_cache_lookups.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                pieces = [cached]
+                yield sse_event("token", {"token": cached})
+            else:
+                pieces = []
+                # Includes time spent waiting on the client to read each token
+                with letter_stage_seconds.time(stage="llm"):
+                    tokens = stream_letter_content(letter_data, llama_model=LLAMA_MODEL, on_stats=record_llm_stats)
+                    for token in tokens:
+                        pieces.append(token)
+                        yield sse_event("token", {"token": token})
+                with letter_stage_seconds.time(stage="cache_store"):
+                    letter_cache.put(key, LLAMA_MODEL, "".join(pieces))
+
+            stream_db = SessionLocal()
+            try:
+                result = save_letter(stream_db, letter_data, "".join(pieces))
+            finally:
+                stream_db.close()
+            yield sse_event("done", result)
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/letters/generate/batch")
+def generate_letter_batch(items: List[Dict[str, Any]] = Body(..., embed=True)):
+    """Generate letters for many patients in one request.
+
+    The batch runs as a letter job, so it carries on and is saved even if the
+    client goes away; job_url reports the outcome. Streams newline-delimited
+    JSON: a "queued" line with the job id, one line per item as it finishes,
+    then a summary line once every generated letter is saved in a single commit.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="No letters requested")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} letters per batch")
+
+    batch_id = uuid.uuid4().hex
+    job_id = letter_jobs.enqueue({"batch_id": batch_id, "batch_items": items})
+
+    async def progress():
+        yield json.dumps({"status": "queued", "job_id": job_id, "job_url": f"/letters/jobs/{job_id}"}) + "\n"
+
+        sent = 0
+        finished = False
+        while not finished:
+            finished = await letter_jobs.wait(job_id, timeout=1)
+            lines = batch_progress.get(batch_id, [])
+            for line in lines[sent:]:
+                yield json.dumps(line) + "\n"
+            sent = max(sent, len(lines))
+
+        job = await run_in_threadpool(letter_jobs.get, job_id)
+        if job["status"] != "done":
+            yield json.dumps({"status": "failed", "error": job["error"]}) + "\n"
+            return
+        summary = dict(job["result"])
+        # Lines that finished after the last check
+        for line in summary.pop("items")[sent:]:
+            yield json.dumps(line) + "\n"
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,54 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.environ.get("NHSCRIBE_DB_PATH", os.path.join(BASE_DIR, "scribe.db"))
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # readers no longer block on the writer
+    "synchronous": "NORMAL",     # durable with WAL, and one fsync per checkpoint instead of per commit
+    "busy_timeout": 5000,        # wait for a lock rather than failing with "database is locked"
+    "cache_size": -16000,        # 16 MB page cache
+    "temp_store": "MEMORY",
+    "mmap_size": 64 * 1024 * 1024,
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def make_engine(url: str = DATABASE_URL):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        echo=False
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def make_async_engine(url: str = ASYNC_DATABASE_URL):
+    """Engine for async def endpoints: queries run on aiosqlite's connection thread, not the threadpool."""
+    engine = create_async_engine(url, echo=False)
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+engine = make_engine()
+
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+async_engine = make_async_engine()
+
+# expire_on_commit=False: attributes can't be lazily reloaded outside an await
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
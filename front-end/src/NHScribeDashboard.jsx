@@ -98,6 +98,38 @@ export default function NHScribeDashboard() {
     }
 
     fetchLetters();
+
+    // Apply pushed changes instead of re-polling /letters/recent
+    const events = new EventSource(`${API_BASE_URL}/letters/events`);
+
+    events.addEventListener("created", (e) => {
+      const letter = JSON.parse(e.data);
+      setRecentLetters((letters) =>
+        [letter, ...letters.filter((l) => l.id !== letter.id)].slice(0, 10)
+      );
+    });
+
+    const applyUpdate = (e) => {
+      const letter = JSON.parse(e.data);
+      setRecentLetters((letters) =>
+        letters.map((l) => (l.id === letter.id ? { ...l, ...letter } : l))
+      );
+    };
+    events.addEventListener("status", applyUpdate);
+    events.addEventListener("content", applyUpdate);
+
+    // Events were missed (backlog overflow or reconnect): refetch the list
+    events.addEventListener("resync", fetchLetters);
+    let reconnecting = false;
+    events.onopen = () => {
+      if (reconnecting) fetchLetters();
+      reconnecting = false;
+    };
+    events.onerror = () => {
+      reconnecting = true;
+    };
+
+    return () => events.close();
   }, []);
 
   const draftCount = recentLetters.filter(
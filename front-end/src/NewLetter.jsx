@@ -5,6 +5,9 @@ import Nhscribe from "./assets/Nhscribe.png";
 import { useNavigate } from "react-router-dom";
 import { API_BASE_URL } from "./config";
 
+// PATIENT_SEARCH_MAX in app.py
+const PATIENT_CHECK_LIMIT = 100;
+
 export default function NewLetter() {
   const navigate = useNavigate();
 
@@ -54,7 +57,12 @@ export default function NewLetter() {
       setCheckStatus(null);
       setCheckMessage("Checking…");
 
-      const res = await fetch(`${API_BASE_URL}/patients/`);
+      // Search is ranked by prefix, so narrow it by age/sex and take the most
+      // the server allows, or the exact name can fall outside the results
+      const params = new URLSearchParams({ name: form.name.trim(), limit: String(PATIENT_CHECK_LIMIT) });
+      if (form.age) params.set("age", String(Number(form.age)));
+      if (form.sex) params.set("sex", form.sex);
+      const res = await fetch(`${API_BASE_URL}/patients/search/?${params}`);
       if (!res.ok) throw new Error(`HTTP ${res.status}`);
       const patients = await res.json();
 
@@ -192,9 +200,20 @@ export default function NewLetter() {
         throw new Error(msg || `HTTP ${res.status}`);
       }
 
-      const data = await res.json();
+      const queued = await res.json();
+
+      // Generation runs as a background job; long-poll until it finishes
+      let job = queued;
+      while (job.status === "queued" || job.status === "running") {
+        const jobRes = await fetch(`${API_BASE_URL}${queued.job_url}?wait=25`);
+        if (!jobRes.ok) throw new Error(`HTTP ${jobRes.status}`);
+        job = await jobRes.json();
+      }
+      if (job.status !== "done") throw new Error(job.error || "Letter generation failed");
+
+      const data = job.result;
 
-      let pdf_path = `${API_BASE_URL}/static/${data.pdf_url}`;
+      let pdf_path = `${API_BASE_URL}${data.html_url}`;
 
       setPdfPath(pdf_path);
     
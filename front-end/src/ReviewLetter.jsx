@@ -3,6 +3,7 @@ import { useParams, useNavigate } from "react-router-dom";
 import "./ReviewLetter.css";
 import Nhscribe from "./assets/Nhscribe.png";
 import { API_BASE_URL } from "./config";
+import { diffEdits, rebaseText } from "./textEdits";
 
 function Pill({ label, variant }) {
   return <span className={`pill ${variant || "default"}`}>{label}</span>;
@@ -55,19 +56,34 @@ export default function ReviewLetter() {
   async function handleSave(silent = false) {
     if (!silent) setSaving(true);
     
+    // Only the changed span is sent, against the version we last saw
+    const saved = content;
+    const edits = diffEdits(letter.content || "", saved);
+
     try {
       const res = await fetch(`${API_BASE_URL}/letters/${letterId}/content`, {
-        method: "PUT",
+        method: "PATCH",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ content }),
+        body: JSON.stringify({ base_version: letter.contentVersion, edits }),
       });
 
+      if (res.status === 409) {
+        // Edited elsewhere: redo our change on top of theirs; the next autosave sends it
+        const latest = await fetch(`${API_BASE_URL}/letters/${letterId}`).then((r) => r.json());
+        const merged = rebaseText(letter.content || "", saved, latest.content || "");
+        setLetter(latest);
+        // Anything typed while this was in flight is kept as is
+        setContent((current) => (current === saved ? merged : current));
+        setSaveMessage("Letter was also changed elsewhere; your edits were kept");
+        setTimeout(() => setSaveMessage(""), 5000);
+        return;
+      }
       if (!res.ok) throw new Error("Failed to save");
       
       const data = await res.json();
-      setLetter(data);
+      setLetter((current) => ({ ...current, content: saved, contentVersion: data.contentVersion }));
       
       if (!silent) {
         setSaveMessage("✓ Saved successfully");
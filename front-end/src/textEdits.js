@@ -0,0 +1,42 @@
+// Smallest single splice turning `before` into `after`, for PATCH /letters/{id}/content.
+// Typing usually touches one spot, so the common prefix and suffix cover the rest.
+function diffEdits(before, after) {
+  if (before === after) return [];
+
+  let start = 0;
+  const maxPrefix = Math.min(before.length, after.length);
+  while (start < maxPrefix && before[start] === after[start]) start++;
+
+  let endBefore = before.length;
+  let endAfter = after.length;
+  while (
+    endBefore > start &&
+    endAfter > start &&
+    before[endBefore - 1] === after[endAfter - 1]
+  ) {
+    endBefore--;
+    endAfter--;
+  }
+
+  return [{ start, end: endBefore, text: after.slice(start, endAfter) }];
+}
+
+// Redo the local change (base -> local) on top of `latest`, the text someone else saved
+// meanwhile. If both changed the same span the local text wins, so typing is never lost.
+function rebaseText(base, local, latest) {
+  const [mine] = diffEdits(base, local);
+  const [theirs] = diffEdits(base, latest);
+  if (!mine) return latest;
+  if (!theirs) return local;
+
+  if (mine.end <= theirs.start) {
+    return latest.slice(0, mine.start) + mine.text + latest.slice(mine.end);
+  }
+  if (theirs.end <= mine.start) {
+    const shift = theirs.text.length - (theirs.end - theirs.start);
+    return latest.slice(0, mine.start + shift) + mine.text + latest.slice(mine.end + shift);
+  }
+  return local;
+}
+
+export { diffEdits, rebaseText };
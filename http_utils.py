@@ -0,0 +1,108 @@
+import gzip
+import threading
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is used when brotli isn't installed
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/css", "text/javascript")
+
+
+class VersionCounter:
+    """In-process change counter for a table, used to build ETags without querying it.
+
+    The epoch changes on every restart, so ETags handed out by a previous
+    process never match.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.epoch = uuid.uuid4().hex[:8]
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+    def etag(self, variant: str = "") -> str:
+        return f'W/"{self.name}-{self.epoch}-{self.value}{"-" + variant if variant else ""}"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+class CompressionMiddleware:
+    """Brotli/gzip compression for complete JSON, HTML, CSS and JS responses.
+
+    Streaming responses (SSE, NDJSON, PDFs, ZIPs) pass through untouched, so
+    tokens and progress lines are never held back in a compressor buffer.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip()
+                if media_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers:
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or too small to be worth it: send as-is
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            if encoding == "br":
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                body = gzip.compress(body, compresslevel=self.gzip_level)
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime
+
+from models import LetterJob
+
+
+class LetterJobQueue:
+    """Letter generation jobs persisted in the database and drained by a fixed pool of worker threads."""
+
+    def __init__(self, session_factory, handler, workers: int = 2):
+        self.session_factory = session_factory
+        self.handler = handler
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._finished = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Re-queue jobs left over from a previous run and start the workers."""
+        if self._threads:
+            return
+
+        for job_uid in self._pending_jobs():
+            self._track(job_uid)
+            self._queue.put(job_uid)
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"letter-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, payload: dict) -> str:
+        job_uid = uuid.uuid4().hex
+
+        db = self.session_factory()
+        try:
+            db.add(LetterJob(job_uid=job_uid, status="queued", payload=json.dumps(payload)))
+            db.commit()
+        finally:
+            db.close()
+
+        self._track(job_uid)
+        self._queue.put(job_uid)
+        return job_uid
+
+    def get(self, job_uid: str):
+        db = self.session_factory()
+        try:
+            job = db.query(LetterJob).filter(LetterJob.job_uid == job_uid).first()
+            return job_to_dict(job) if job else None
+        finally:
+            db.close()
+
+    async def wait(self, job_uid: str, timeout: float, interval: float = 0.25) -> bool:
+        """Wait (without holding a thread) until the job finishes or the timeout passes. True if it's finished."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        with self._lock:
+            finished = self._finished.get(job_uid)
+
+        while finished is not None and not finished.is_set() and loop.time() < deadline:
+            await asyncio.sleep(interval)
+        return finished is None or finished.is_set()
+
+    def _track(self, job_uid: str):
+        with self._lock:
+            self._finished[job_uid] = threading.Event()
+
+    def _pending_jobs(self):
+        db = self.session_factory()
+        try:
+            # Anything still "running" was interrupted by a restart, so run it again
+            interrupted = db.query(LetterJob).filter(LetterJob.status == "running").all()
+            for job in interrupted:
+                job.status = "queued"
+            db.commit()
+
+            pending = (
+                db.query(LetterJob.job_uid)
+                .filter(LetterJob.status == "queued")
+                .order_by(LetterJob.id)
+                .all()
+            )
+            return [row.job_uid for row in pending]
+        finally:
+            db.close()
+
+    def _worker(self):
+        while True:
+            job_uid = self._queue.get()
+            if job_uid is None:
+                break
+            try:
+                self._run(job_uid)
+            except Exception as e:
+                print(f"Letter job {job_uid} crashed: {e}")
+            finally:
+                with self._lock:
+                    finished = self._finished.pop(job_uid, None)
+                if finished:
+                    finished.set()
+
+    def _run(self, job_uid: str):
+        db = self.session_factory()
+        try:
+            job = db.query(LetterJob).filter(LetterJob.job_uid == job_uid).first()
+            if not job or job.status != "queued":
+                return
+
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job.attempts = (job.attempts or 0) + 1
+            db.commit()
+
+            try:
+                result = self.handler(db, json.loads(job.payload))
+            except Exception as e:
+                db.rollback()
+                job = db.query(LetterJob).filter(LetterJob.job_uid == job_uid).first()
+                job.status = "failed"
+                job.error = str(getattr(e, "detail", e))
+            else:
+                job.status = "done"
+                job.result = json.dumps(result)
+                job.letter_uid = result.get("letter_uid")
+
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+
+def job_to_dict(job: LetterJob) -> dict:
+    return {
+        "job_id": job.job_uid,
+        "status": job.status,
+        "letter_uid": job.letter_uid,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "attempts": job.attempts,
+        "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+        "started_at": job.started_at.strftime("%Y-%m-%d %H:%M:%S") if job.started_at else None,
+        "finished_at": job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+    }
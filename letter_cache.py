@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+from datetime import datetime
+
+from models import LetterCacheEntry
+from letter_utils.generate_letter_content import build_prompt
+
+# Bump when the way letters are generated changes (beyond the prompt text) so old letters are not reused
+PROMPT_VERSION = 2
+
+
+def cache_key(letter_data: dict, model: str) -> str:
+    """Hash of the model and the exact prompt it would be given, so a hit is always the same request."""
+    canonical = json.dumps(
+        {"prompt_version": PROMPT_VERSION, "model": model, "prompt": build_prompt(letter_data)},
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LetterCache:
+    """Generated letter bodies stored in the database, evicting the least recently used past max_entries."""
+
+    def __init__(self, session_factory, max_entries: int = 512):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        db = self.session_factory()
+        try:
+            entry = db.get(LetterCacheEntry, key)
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_used_at = datetime.utcnow()
+            content = entry.content
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, key: str, model: str, content: str):
+        db = self.session_factory()
+        try:
+            db.merge(LetterCacheEntry(
+                cache_key=key,
+                model=model,
+                content=content,
+                hit_count=0,
+                created_at=datetime.utcnow(),
+                last_used_at=datetime.utcnow(),
+            ))
+            db.flush()
+
+            excess = db.query(LetterCacheEntry).count() - self.max_entries
+            if excess > 0:
+                oldest = (
+                    db.query(LetterCacheEntry.cache_key)
+                    .order_by(LetterCacheEntry.last_used_at)
+                    .limit(excess)
+                    .subquery()
+                )
+                db.query(LetterCacheEntry).filter(
+                    LetterCacheEntry.cache_key.in_(oldest.select())
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def clear(self) -> int:
+        db = self.session_factory()
+        try:
+            removed = db.query(LetterCacheEntry).delete()
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        db = self.session_factory()
+        try:
+            entries = db.query(LetterCacheEntry).count()
+        finally:
+            db.close()
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
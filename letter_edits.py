@@ -0,0 +1,176 @@
+import threading
+import time
+
+import letter_store
+from models import Letter
+
+
+class EditConflict(Exception):
+    """The client edited an older version of the letter's text than the current one."""
+
+    def __init__(self, version: int):
+        super().__init__(f"Letter is at version {version}")
+        self.version = version
+
+
+def apply_edits(content: str, edits) -> str:
+    """Apply splice edits [(start, end, text), ...] in order, each to the result of the last.
+
+    Offsets count UTF-16 code units, as JavaScript string indices do, so a
+    diff computed in the browser lines up even around emoji. The browser may
+    send half of a surrogate pair (swapping one emoji for another that shares
+    its first unit); that's fine as long as the result is whole again.
+    """
+    units = content.encode("utf-16-le", "surrogatepass")
+    for start, end, text in edits:
+        if not 0 <= start <= end <= len(units) // 2:
+            raise ValueError(f"Edit {start}-{end} is outside the letter ({len(units) // 2} characters)")
+        units = units[:start * 2] + text.encode("utf-16-le", "surrogatepass") + units[end * 2:]
+    try:
+        return units.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise ValueError("Edit splits a surrogate pair")
+
+
+class LetterEditBuffer:
+    """Holds patched letter content in memory and writes each letter back in one commit.
+
+    A letter is written once no edit has arrived for `delay` seconds, or
+    `max_delay` seconds after its first unsaved edit, whichever comes first, so a
+    burst of autosaves becomes a single write. Every accepted patch bumps the
+    letter's content_version straight away, so concurrency checks don't wait for
+    the write; the row version (for ETags) is bumped when it's written.
+    Anything reading letter content should call flush(letter_uid) first.
+
+    Edits are never dropped: a write that fails is put back and retried, backing
+    off from retry_delay up to max_retry_delay seconds between attempts.
+    """
+
+    def __init__(self, session_factory, on_flush, delay: float = 2.0, max_delay: float = 10.0,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.session_factory = session_factory
+        self.on_flush = on_flush
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._pending = {}  # letter_uid -> [content, content_version, first edit time, timer, failed writes]
+        # letter_uid -> (content, content_version, failed writes) taken out of _pending, not yet committed
+        self._writing = {}
+        # _lock guards the dicts and is never held during database writes, so a slow
+        # write doesn't hold up patches; _write_lock keeps the writes in order
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def patch(self, db, letter_uid: str, base_version: int, edits):
+        """Apply edits made against base_version. Returns the new version, or None if the letter doesn't exist."""
+        with self._lock:
+            pending = self._pending.get(letter_uid)
+            if pending:
+                content, version, first_edit, timer, _ = pending
+                timer.cancel()
+            elif letter_uid in self._writing:
+                # Carry on from the content being written rather than the stale row
+                (content, version, _), first_edit = self._writing[letter_uid], time.monotonic()
+            else:
+                row = (
+                    db.query(Letter.content, Letter.content_version)
+                    .filter(Letter.letter_uid == letter_uid)
+                    .first()
+                )
+                if not row:
+                    return None
+                content, version, first_edit = row.content or "", row.content_version or 1, time.monotonic()
+
+            if base_version != version:
+                if pending:
+                    self._schedule(letter_uid, content, version, first_edit)
+                raise EditConflict(version)
+
+            try:
+                content = apply_edits(content, edits)
+            except ValueError:
+                if pending:
+                    self._schedule(letter_uid, content, version, first_edit)
+                raise
+
+            self._schedule(letter_uid, content, version + 1, first_edit)
+            return version + 1
+
+    def flush(self, letter_uid: str) -> bool:
+        """Write the letter's pending edits, if any, and wait for the commit.
+
+        Returns False if the write failed; the edits are then kept and retried later.
+        """
+        with self._lock:
+            pending = self._pending.pop(letter_uid, None)
+            if pending is not None:
+                content, version, _, timer, failures = pending
+                timer.cancel()
+                self._writing[letter_uid] = (content, version, failures)
+
+        with self._write_lock:
+            with self._lock:
+                writing = self._writing.get(letter_uid)
+            if writing is None:
+                return True  # nothing to write, or another flush already wrote it
+            content, version, failures = writing
+            saved = self._write(letter_uid, content, version)
+            with self._lock:
+                if self._writing.get(letter_uid) is writing:
+                    del self._writing[letter_uid]
+                    # A patch made during the write already carries these edits forward
+                    if not saved and letter_uid not in self._pending:
+                        self._retry(letter_uid, content, version, failures + 1)
+            return saved
+
+    def _write(self, letter_uid: str, content: str, version: int) -> bool:
+        db = self.session_factory()
+        try:
+            letter, patient_name = letter_store.get_letter_for_update(db, letter_uid)
+            if not letter:
+                return True  # deleted: nothing left to save
+            letter.content = content
+            letter.content_version = version
+            letter.version = (letter.version or 1) + 1
+            saved = letter_store.from_letter(letter, patient_name)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Failed to save edits to letter {letter_uid}, will retry: {e}")
+            return False
+        finally:
+            db.close()
+
+        try:
+            self.on_flush(saved)
+        except Exception as e:
+            print(f"Saved edits to letter {letter_uid} but on_flush failed: {e}")
+        return True
+
+    def flush_all(self) -> bool:
+        """Write every letter's pending edits. Returns False if any write failed."""
+        with self._lock:
+            letter_uids = set(self._pending) | set(self._writing)
+        return all([self.flush(letter_uid) for letter_uid in letter_uids])
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def has_pending(self, letter_uid: str) -> bool:
+        return letter_uid in self._pending or letter_uid in self._writing
+
+    def _schedule(self, letter_uid, content, version, first_edit):
+        wait = min(self.delay, max(0.0, first_edit + self.max_delay - time.monotonic()))
+        self._start_timer(letter_uid, wait, [content, version, first_edit, None, 0])
+
+    def _retry(self, letter_uid, content, version, failures):
+        wait = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+        self._start_timer(letter_uid, wait, [content, version, time.monotonic(), None, failures])
+
+    def _start_timer(self, letter_uid, wait, pending):
+        pending[3] = timer = threading.Timer(wait, self.flush, args=(letter_uid,))
+        timer.daemon = True
+        self._pending[letter_uid] = pending
+        timer.start()
@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import signal
+import threading
+
+
+class EventBroker:
+    """Fans letter change events out to every connected /letters/events stream.
+
+    publish() is safe to call from worker threads: events are handed to the
+    event loop, which puts them on each subscriber's queue. A subscriber that
+    falls too far behind gets its backlog replaced by a single "resync" event.
+    """
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._loop = None
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._stopped = False
+
+    def stop(self):
+        """End every open stream. Called on the event loop."""
+        self._stopped = True
+        for queue in list(self._subscribers):
+            self._close(queue)
+        self._loop = None
+
+    def stop_on_exit_signals(self, signals=(signal.SIGINT, signal.SIGTERM)):
+        """End the streams as soon as the server is asked to exit.
+
+        Uvicorn waits for open connections to close before it runs the lifespan
+        shutdown, so a stream only ended there would hold up every shutdown and
+        --reload restart. Chains onto the server's own handlers; only possible
+        from the main thread.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = self._loop
+        for sig in signals:
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue  # default or ignored: leave it alone
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.stop)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        if self._stopped:
+            # Shutting down: the stream ends straight away
+            self._close(queue)
+        else:
+            self._subscribers.add(queue)
+        return queue
+
+    @staticmethod
+    def _close(queue: asyncio.Queue):
+        while queue.full():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: dict):
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        with self._lock:
+            message = (next(self._ids), event, data)
+        try:
+            loop.call_soon_threadsafe(self._fan_out, message)
+        except RuntimeError:
+            pass  # loop already closed during shutdown
+
+    def _fan_out(self, message):
+        for queue in list(self._subscribers):
+            self._deliver(queue, message)
+
+    def _deliver(self, queue: asyncio.Queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind to catch up event by event: tell the client to refetch
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait((message[0], "resync", {}))
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+from models import Letter, Patient
+
+# Letter reads go through here: each loads letters together with their
+# patient's name in one statement and hands back plain dataclasses, so callers
+# never trigger lazy loads or refreshes by touching an attribute.
+
+
+@dataclass(slots=True)
+class LetterSummary:
+    id: int
+    letter_uid: str
+    patient_id: Optional[int]
+    patient_name: Optional[str]
+    doctor_name: Optional[str]
+    status: Optional[str]
+    details: Optional[str]
+    created_at: Optional[datetime]
+    approved_at: Optional[datetime]
+    version: int
+
+
+@dataclass(slots=True)
+class LetterDetail(LetterSummary):
+    content: Optional[str]
+    file_path: Optional[str]
+    content_version: int
+
+
+SUMMARY_COLUMNS = (
+    Letter.id, Letter.letter_uid, Letter.patient_id, Patient.name.label("patient_name"),
+    Letter.doctor_name, Letter.status, Letter.details, Letter.created_at, Letter.approved_at,
+    Letter.version,
+)
+DETAIL_COLUMNS = SUMMARY_COLUMNS + (Letter.content, Letter.file_path, Letter.content_version)
+
+
+def summary_query():
+    return select(*SUMMARY_COLUMNS).outerjoin(Patient, Patient.id == Letter.patient_id)
+
+
+def detail_query(letter_uid: str):
+    return (
+        select(*DETAIL_COLUMNS)
+        .outerjoin(Patient, Patient.id == Letter.patient_id)
+        .where(Letter.letter_uid == letter_uid)
+    )
+
+
+def recent_query(limit: int):
+    return summary_query().order_by(Letter.created_at.desc(), Letter.id.desc()).limit(limit)
+
+
+def to_summary(row) -> LetterSummary:
+    return LetterSummary(**{**row._mapping, "version": row.version or 1})
+
+
+def to_detail(row) -> LetterDetail:
+    return LetterDetail(
+        **{**row._mapping, "version": row.version or 1, "content_version": row.content_version or 1}
+    )
+
+
+def from_letter(letter: Letter, patient_name: Optional[str]) -> LetterDetail:
+    """Snapshot a Letter that's already loaded, e.g. before committing changes to it."""
+    return LetterDetail(
+        id=letter.id,
+        letter_uid=letter.letter_uid,
+        patient_id=letter.patient_id,
+        patient_name=patient_name,
+        doctor_name=letter.doctor_name,
+        status=letter.status,
+        details=letter.details,
+        created_at=letter.created_at,
+        approved_at=letter.approved_at,
+        version=letter.version or 1,
+        content=letter.content,
+        file_path=letter.file_path,
+        content_version=letter.content_version or 1,
+    )
+
+
+def get_letter(db, letter_uid: str) -> Optional[LetterDetail]:
+    row = db.execute(detail_query(letter_uid)).first()
+    return to_detail(row) if row else None
+
+
+async def get_letter_async(db, letter_uid: str) -> Optional[LetterDetail]:
+    row = (await db.execute(detail_query(letter_uid))).first()
+    return to_detail(row) if row else None
+
+
+async def recent_letters_async(db, limit: int = 10):
+    return [to_summary(row) for row in await db.execute(recent_query(limit))]
+
+
+def get_letter_for_update(db, letter_uid: str):
+    """The Letter row to modify plus its patient's name, in one statement. (None, None) if missing."""
+    row = db.execute(
+        select(Letter, Patient.name)
+        .outerjoin(Patient, Patient.id == Letter.patient_id)
+        .where(Letter.letter_uid == letter_uid)
+    ).first()
+    return (row[0], row[1]) if row else (None, None)
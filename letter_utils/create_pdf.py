@@ -1,14 +1,33 @@
 import os
+import html
 import hashlib
 import secrets
 from datetime import date
+from string import Template
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 LETTERS_DIR = os.path.join(PROJECT_ROOT, "letters")
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
 
 # Ensure the letters folder exists
 os.makedirs(LETTERS_DIR, exist_ok=True)
 
+# Parsed once at import; each letter is a single substitute() call
+with open(os.path.join(TEMPLATES_DIR, "letter.html"), encoding="utf-8") as f:
+    LETTER_TEMPLATE = Template(f.read())
+
+# Stylesheet and auto-save script shared by every letter page, served from /assets/
+LETTER_ASSETS = {}
+for asset_name, media_type in (("letter.css", "text/css"), ("letter.js", "text/javascript")):
+    with open(os.path.join(STATIC_DIR, asset_name), "rb") as f:
+        LETTER_ASSETS[asset_name] = (f.read(), media_type)
+
+# Part of the asset URLs, so browsers can cache them forever and still pick up changes
+ASSET_VERSION = hashlib.sha256(
+    b"".join(body for body, _ in LETTER_ASSETS.values())
+).hexdigest()[:12]
+
 
 def generate_unique_filename(extension=".html"):
     """Generate a unique hash-based filename that doesn't collide."""
@@ -23,6 +42,24 @@ def generate_unique_filename(extension=".html"):
             return file_name, hash_name
 
 
+def new_letter_uid() -> str:
+    """A 12-character letter uid for letters that aren't written to disk, so no file check is needed."""
+    return secrets.token_hex(6)
+
+
+def render_letter_html(letter_uid: str, patient_name: str, letter_content: str,
+                       doctor_name: str, letter_date: str) -> str:
+    """Fill the letter template; the page links the shared stylesheet and script."""
+    return LETTER_TEMPLATE.substitute(
+        asset_version=ASSET_VERSION,
+        letter_uid=html.escape(letter_uid),
+        patient_name=html.escape(patient_name),
+        letter_content=html.escape(letter_content),
+        doctor_name=html.escape(doctor_name),
+        today=letter_date,
+    )
+
+
 def create_pdf(patient_name: str, letter_content: str, doctor_name: str = "Farhan") -> dict:
     """Create an HTML letter and return its filename and letter_uid."""
 
@@ -32,229 +69,7 @@ def create_pdf(patient_name: str, letter_content: str, doctor_name: str = "Farha
     # Generate current date
     today = date.today().strftime("%B %d, %Y")
 
-    # Create HTML content
-    html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Medical Letter - {patient_name}</title>
-    <style>
-        body {{
-            font-family: 'Times New Roman', serif;
-            font-size: 12pt;
-            line-height: 1.6;
-            max-width: 8.5in;
-            margin: 0 auto;
-            padding: 1in;
-            background-color: #ffffff;
-            color: #000000;
-        }}
-        
-        .letterhead {{
-            border-bottom: 2px solid #003366;
-            padding-bottom: 20px;
-            margin-bottom: 30px;
-        }}
-        
-        .sender-info {{
-            font-weight: bold;
-            font-size: 14pt;
-            color: #003366;
-            margin-bottom: 5px;
-        }}
-        
-        .sender-address {{
-            font-size: 10pt;
-            color: #666666;
-            margin-bottom: 10px;
-        }}
-        
-        .date {{
-            font-size: 12pt;
-            margin-bottom: 30px;
-        }}
-        
-        .recipient {{
-            margin-bottom: 20px;
-            font-size: 12pt;
-        }}
-        
-        .letter-body {{
-            font-size: 12pt;
-            white-space: pre-wrap;
-            margin-bottom: 30px;
-        }}
-        
-        .signature {{
-            margin-top: 40px;
-            font-size: 12pt;
-        }}
-        
-        .signature-line {{
-            margin-bottom: 5px;
-        }}
-        
-        .signature-name {{
-            font-weight: bold;
-        }}
-        
-        .signature-title {{
-            font-style: italic;
-            color: #666666;
-            font-size: 11pt;
-        }}
-        
-        .download-section {{
-            margin-top: 30px;
-            padding: 15px;
-            background: #f8f9fa;
-            border: 1px solid #e9ecef;
-            border-radius: 5px;
-            text-align: center;
-            font-size: 12pt;
-        }}
-        
-        .download-btn {{
-            background: #1aa4af;
-            color: white;
-            border: none;
-            padding: 10px 20px;
-            border-radius: 5px;
-            cursor: pointer;
-            font-size: 12pt;
-            text-decoration: none;
-            display: inline-block;
-            margin: 5px;
-            transition: background-color 0.2s;
-        }}
-        
-        .download-btn:hover {{
-            background: #c82333;
-        }}
-        
-        .download-btn:visited {{
-            color: white;
-        }}
-        
-        /* Editable content styling */
-        .editable {{
-            border: 1px solid transparent;
-            padding: 2px;
-            border-radius: 3px;
-            transition: border-color 0.2s;
-        }}
-        
-        .editable:hover {{
-            border-color: #cccccc;
-        }}
-        
-        .editable:focus {{
-            outline: none;
-            border-color: #007bff;
-            background-color: #f8f9fa;
-        }}
-        
-        /* Print styles */
-        @media print {{
-            body {{
-                margin: 0;
-                padding: 0.5in;
-            }}
-            .download-section {{
-                display: none;
-            }}
-            .editable {{
-                border: none;
-            }}
-            .editable:hover {{
-                border: none;
-            }}
-        }}
-    </style>
-</head>
-<body data-letter-id="{letter_uid}">
-    <div class="letterhead">
-        <div class="sender-info">NHS</div>
-        <div class="sender-address">
-            Computer Science Building<br />
-            Jubilee Campus<br />
-            University of Nottingham<br />
-        </div>
-    </div>
-    
-    <div class="date">{today}</div>
-    
-    <div class="recipient">
-        Dear {patient_name},
-    </div>
-    
-    <div class="letter-body editable" contenteditable="true" id="letter-content">
-{letter_content}
-    </div>
-    
-    <div class="signature">
-        <div class="signature-line">Sincerely,</div>
-        <div class="signature-name">{doctor_name}</div>
-        <div class="signature-title">NHS Medical Professional</div>
-    </div>
-    
-    <div class="download-section">
-        <p><strong>Download Options:</strong></p>
-        <a href="/letters/{letter_uid}/pdf" class="download-btn" target="_blank">
-            Download PDF
-        </a>
-        <button class="download-btn" onclick="window.print()">
-            Print Letter
-        </button>
-    </div>
-
-    <script>
-        // Auto-save functionality
-        let saveTimeout;
-        const letterContent = document.getElementById('letter-content');
-        
-        function autoSave() {{
-            clearTimeout(saveTimeout);
-            saveTimeout = setTimeout(() => {{
-                // Send updated content to server
-                const updatedContent = letterContent.textContent;
-                
-                // Get letter ID from URL or data attribute
-                const letterId = document.body.getAttribute('data-letter-id');
-                if (letterId) {{
-                    fetch(`http://10.249.82.165:8000/letters/${{letterId}}/content`, {{
-                        method: 'PUT',
-                        headers: {{
-                            'Content-Type': 'application/json',
-                        }},
-                        body: JSON.stringify({{ content: updatedContent }})
-                    }})
-                    .then(response => response.json())
-                    .then(data => {{
-                        console.log('Auto-saved:', data);
-                    }})
-                    .catch(error => {{
-                        console.error('Auto-save failed:', error);
-                    }});
-                }}
-            }}, 2000); // Save after 2 seconds of inactivity
-        }}
-        
-        // Add event listener for content changes
-        letterContent.addEventListener('input', autoSave);
-        
-        // Add keyboard shortcuts
-        document.addEventListener('keydown', function(e) {{
-            // Ctrl+S to save
-            if (e.ctrlKey && e.key === 's') {{
-                e.preventDefault();
-                autoSave();
-            }}
-        }});
-    </script>
-</body>
-</html>"""
+    html_content = render_letter_html(letter_uid, patient_name, letter_content, doctor_name, today)
 
     # Write HTML to file
     with open(file_path, 'w', encoding='utf-8') as f:
@@ -1,16 +1,29 @@
-import ollama
 import json
 import datetime
 
-def generate_letter_content(letter_data: dict, llama_model: str = "llama3.2:1b") -> str:
-    llama_client = ollama.Client()
+from letter_utils.ollama_client import get_client, response_stats, KEEP_ALIVE
 
-    test_data_str = json.dumps(letter_data)
+# The only result fields the model sees. Anything else an upload row carries
+# (sample dates, file names, batch ids, parsed numbers) stays out of the prompt,
+# so it can't leak into a letter cached for another patient.
+PROMPT_RESULT_FIELDS = ("test_name", "value", "unit", "flag", "reference_low", "reference_high")
 
-    patient = letter_data["patient"]
-    results = letter_data["results"]
 
-    sex = patient["sex"]
+def _text(value) -> str:
+    return str(value if value is not None else "").strip()
+
+
+def prompt_results(results: list) -> list:
+    """The results as shown to the model: PROMPT_RESULT_FIELDS only, trimmed, in a fixed order."""
+    rows = [{field: _text(r.get(field)) for field in PROMPT_RESULT_FIELDS} for r in results]
+    return sorted(rows, key=lambda row: tuple(row[field].lower() for field in PROMPT_RESULT_FIELDS))
+
+
+def build_prompt(letter_data: dict) -> str:
+    patient = letter_data.get("patient", {})
+    results = json.dumps(prompt_results(letter_data.get("results", [])), ensure_ascii=False)
+
+    sex = _text(patient.get("sex")).upper()
 
     prompt = f"""
     You are an NHS medical transcriptionist tasked with creating a realistic, 
@@ -36,7 +49,33 @@ def generate_letter_content(letter_data: dict, llama_model: str = "llama3.2:1b")
     Only return the completed letter — no JSON, no code, no notes.
     """
 
+    return prompt
+
+
+def generate_letter_content(letter_data: dict, llama_model: str = "llama3.2:1b", on_stats=None) -> str:
+    """Letter text from the model. on_stats, if given, is called with the call's response_stats()."""
+    llama_client = get_client()
+
+    prompt = build_prompt(letter_data)
+
     print("Generating letter content...")
-    response = llama_client.generate(model=llama_model, prompt=prompt)
+    response = llama_client.generate(model=llama_model, prompt=prompt, keep_alive=KEEP_ALIVE)
+    if on_stats:
+        on_stats(response_stats(response))
 
     return response.response
+
+
+def stream_letter_content(letter_data: dict, llama_model: str = "llama3.2:1b", on_stats=None):
+    """Yield the letter text piece by piece as the model produces it."""
+    llama_client = get_client()
+
+    prompt = build_prompt(letter_data)
+
+    print("Streaming letter content...")
+    for chunk in llama_client.generate(model=llama_model, prompt=prompt, stream=True, keep_alive=KEEP_ALIVE):
+        if chunk.response:
+            yield chunk.response
+        # Only the final chunk carries the token counts and timings
+        if chunk.done and on_stats:
+            on_stats(response_stats(chunk))
@@ -0,0 +1,54 @@
+import os
+import threading
+
+import ollama
+
+# How long Ollama keeps the model in memory after a request, e.g. "30m", "2h" or -1 for forever
+_keep_alive = os.environ.get("NHSCRIBE_OLLAMA_KEEP_ALIVE", "30m")
+KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ollama.Client:
+    """Process-wide Ollama client, so every call reuses the same pooled HTTP connections."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ollama.Client()
+    return _client
+
+
+def warm_up(llama_model: str) -> bool:
+    """Load the model into memory ahead of the first real request."""
+    try:
+        # An empty prompt makes Ollama load the model without generating anything
+        get_client().generate(model=llama_model, prompt="", keep_alive=KEEP_ALIVE)
+    except Exception as e:
+        print(f"Could not warm up {llama_model}: {e}")
+        return False
+
+    print(f"Model {llama_model} loaded and kept alive for {KEEP_ALIVE}")
+    return True
+
+
+def response_stats(response) -> dict:
+    """Token counts and timings Ollama reports on a finished generate call, durations in seconds."""
+    def seconds(name):
+        nanoseconds = getattr(response, name, None)
+        return nanoseconds / 1e9 if nanoseconds is not None else None
+
+    stats = {
+        "prompt_tokens": getattr(response, "prompt_eval_count", None),
+        "eval_tokens": getattr(response, "eval_count", None),
+        "load_seconds": seconds("load_duration"),
+        "prompt_eval_seconds": seconds("prompt_eval_duration"),
+        "eval_seconds": seconds("eval_duration"),
+        "total_seconds": seconds("total_duration"),
+    }
+    stats["tokens_per_second"] = (
+        stats["eval_tokens"] / stats["eval_seconds"] if stats["eval_tokens"] and stats["eval_seconds"] else None
+    )
+    return stats
@@ -0,0 +1,75 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from letter_utils.render_pdf import render_letter_pdf, letter_styles
+
+
+class PdfPoolBusy(Exception):
+    """Raised when every render slot is taken."""
+
+
+def _preload():
+    # Runs once in each worker: imports ReportLab and builds the letter styles
+    letter_styles()
+
+
+class PdfRenderPool:
+    """Renders letter PDFs in worker processes, so ReportLab neither blocks the event loop nor holds our GIL.
+
+    At most max_pending renders may be queued or running; beyond that submit()
+    raises PdfPoolBusy instead of letting the backlog grow.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the parent is already running threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_preload,
+                )
+                # Start every worker now rather than on the first downloads
+                for _ in range(self.workers):
+                    self._executor.submit(_preload)
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def submit(self, *args, block: bool = False):
+        """Queue a render_letter_pdf call. Waits for a free slot only if block is set."""
+        if not self._slots.acquire(blocking=block):
+            raise PdfPoolBusy()
+        try:
+            future = (self._executor or self.start()).submit(render_letter_pdf, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def render(self, *args, wait: bool = False) -> bytes:
+        """Render in the pool. With wait, retry until a slot frees up rather than raising PdfPoolBusy."""
+        while True:
+            try:
+                future = self.submit(*args)
+                break
+            except PdfPoolBusy:
+                if not wait:
+                    raise
+                await asyncio.sleep(0.05)
+        return await asyncio.wrap_future(future)
@@ -0,0 +1,81 @@
+import io
+import threading
+
+from reportlab.lib.pagesizes import letter as letter_size
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.units import inch
+
+_styles = None
+_styles_lock = threading.Lock()
+
+
+def letter_styles() -> dict:
+    """The sample stylesheet plus the letter's own styles, built once per process."""
+    global _styles
+    if _styles is None:
+        with _styles_lock:
+            if _styles is None:
+                styles = getSampleStyleSheet()
+                _styles = {
+                    "normal": styles['Normal'],
+                    "header": ParagraphStyle(
+                        'CustomHeader',
+                        parent=styles['Heading1'],
+                        fontSize=18,
+                        textColor='#003366',
+                        spaceAfter=12
+                    ),
+                    "address": ParagraphStyle(
+                        'Address',
+                        parent=styles['Normal'],
+                        fontSize=10,
+                        textColor='#666666',
+                        spaceAfter=20
+                    ),
+                    "body": ParagraphStyle(
+                        'Body',
+                        parent=styles['Normal'],
+                        fontSize=11,
+                        leading=16,
+                        spaceAfter=12
+                    ),
+                }
+    return _styles
+
+
+def render_letter_pdf(patient_name: str, content: str, doctor_name: str, date_str: str) -> bytes:
+    """Render a letter to PDF bytes in memory."""
+    styles = letter_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter_size)
+    story = []
+
+    # Add letterhead
+    story.append(Paragraph("NHS", styles["header"]))
+    story.append(Paragraph("Computer Science Building<br /> Jubilee Campus<br /> University of Nottingham<br />", styles["address"]))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Add date
+    story.append(Paragraph(date_str, styles["normal"]))
+    story.append(Spacer(1, 0.3*inch))
+
+    # Add recipient
+    story.append(Paragraph(f"Dear {patient_name},", styles["normal"]))
+    story.append(Spacer(1, 0.2*inch))
+
+    paragraphs = content.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            para_html = para.replace('\n', '<br/>')
+            story.append(Paragraph(para_html, styles["body"]))
+
+    story.append(Spacer(1, 0.4*inch))
+
+    story.append(Paragraph("Sincerely,", styles["normal"]))
+    story.append(Spacer(1, 0.1*inch))
+    story.append(Paragraph(f"<b>{doctor_name}</b>", styles["normal"]))
+    story.append(Paragraph("<i>NHS Medical Professional</i>", styles["address"]))
+
+    doc.build(story)
+    return buffer.getvalue()
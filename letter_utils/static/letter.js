@@ -0,0 +1,112 @@
+// Auto-save functionality
+let saveTimeout;
+const letterContent = document.getElementById('letter-content');
+const letterId = document.body.getAttribute('data-letter-id');
+
+// Last content and content version the server has; edits are sent as a diff against it
+let savedContent = null;
+let savedVersion = null;
+
+function loadSaved() {
+    return fetch(`/letters/${letterId}`)
+        .then(response => response.json())
+        .then(data => {
+            savedContent = data.content;
+            savedVersion = data.contentVersion;
+        });
+}
+
+// Smallest single splice turning `before` into `after`
+function diffEdits(before, after) {
+    if (before === after) return [];
+
+    let start = 0;
+    const maxPrefix = Math.min(before.length, after.length);
+    while (start < maxPrefix && before[start] === after[start]) start++;
+
+    let endBefore = before.length;
+    let endAfter = after.length;
+    while (endBefore > start && endAfter > start && before[endBefore - 1] === after[endAfter - 1]) {
+        endBefore--;
+        endAfter--;
+    }
+
+    return [{ start, end: endBefore, text: after.slice(start, endAfter) }];
+}
+
+// Redo the local change (base -> local) on top of `latest`; if both changed the same span the local text wins
+function rebaseText(base, local, latest) {
+    const [mine] = diffEdits(base, local);
+    const [theirs] = diffEdits(base, latest);
+    if (!mine) return latest;
+    if (!theirs) return local;
+
+    if (mine.end <= theirs.start) {
+        return latest.slice(0, mine.start) + mine.text + latest.slice(mine.end);
+    }
+    if (theirs.end <= mine.start) {
+        const shift = theirs.text.length - (theirs.end - theirs.start);
+        return latest.slice(0, mine.start + shift) + mine.text + latest.slice(mine.end + shift);
+    }
+    return local;
+}
+
+function save() {
+    const updatedContent = letterContent.textContent;
+    const edits = diffEdits(savedContent, updatedContent);
+    if (!edits.length) return;
+
+    fetch(`/letters/${letterId}/content`, {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ base_version: savedVersion, edits })
+    })
+    .then(response => {
+        if (response.status === 409) {
+            // Edited elsewhere: redo our change on top of theirs and save again
+            const base = savedContent;
+            return loadSaved().then(() => {
+                const merged = rebaseText(base, updatedContent, savedContent);
+                // Leave the text alone if more was typed meanwhile; the next save diffs it
+                if (letterContent.textContent === updatedContent && merged !== updatedContent) {
+                    letterContent.textContent = merged;
+                }
+                console.warn('Letter was also changed elsewhere; your edits were kept');
+                autoSave();
+            });
+        }
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json().then(data => {
+            savedContent = updatedContent;
+            savedVersion = data.contentVersion;
+            console.log('Auto-saved version', data.contentVersion);
+        });
+    })
+    .catch(error => {
+        console.error('Auto-save failed:', error);
+    });
+}
+
+function autoSave() {
+    clearTimeout(saveTimeout);
+    if (!letterId || savedVersion === null) return;
+    saveTimeout = setTimeout(save, 2000); // Save after 2 seconds of inactivity
+}
+
+if (letterId) {
+    loadSaved().catch(error => console.error('Could not load letter:', error));
+}
+
+// Add event listener for content changes
+letterContent.addEventListener('input', autoSave);
+
+// Add keyboard shortcuts
+document.addEventListener('keydown', function(e) {
+    // Ctrl+S to save
+    if (e.ctrlKey && e.key === 's') {
+        e.preventDefault();
+        autoSave();
+    }
+});
@@ -0,0 +1,90 @@
+from sqlalchemy import inspect, text
+
+from models import Base
+from result_values import numeric_values
+
+# Indexes replaced by wider ones; dropped from existing databases
+OBSOLETE_INDEXES = [
+    "ix_letters_created_at",
+    "ix_letters_status_created_at",
+    "ix_letters_patient_id",
+]
+
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_result_numbers(conn):
+    """Parse the numeric result columns for rows stored before they existed."""
+    last_id, updated = 0, 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, value, reference_low, reference_high FROM results "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BACKFILL_CHUNK_SIZE}).all()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE results SET value_num = :value_num, ref_low_num = :ref_low_num, "
+                 "ref_high_num = :ref_high_num WHERE id = :id"),
+            [{"id": row.id, **numeric_values(row.value, row.reference_low, row.reference_high)} for row in rows],
+        )
+        updated += len(rows)
+        last_id = rows[-1].id
+    print(f"Backfilled numeric values for {updated} results")
+
+
+# Data to fill in when a column is first added, run in the same transaction
+BACKFILLS = {
+    ("results", "value_num"): backfill_result_numbers,
+}
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to date with models.py.
+
+    create_all only creates missing tables, so columns and indexes added to
+    existing tables since the database was first made are added here.
+    New columns must be nullable or have a server_default, since SQLite can't
+    add a NOT NULL column without one; computed columns are added as VIRTUAL.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        added = []
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                if column.computed is not None:
+                    extra = f" GENERATED ALWAYS AS ({column.computed.sqltext}) VIRTUAL"
+                elif column.server_default is not None:
+                    extra = f" DEFAULT {column.server_default.arg}"
+                else:
+                    extra = ""
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}{extra}'))
+                added.append((table.name, column.name))
+                print(f"Added column {table.name}.{column.name}")
+
+        for key in added:
+            if key in BACKFILLS:
+                BACKFILLS[key](conn)
+
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+        created_index = False
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    created_index = True
+                    print(f"Created index {index.name}")
+
+        if created_index and engine.dialect.name == "sqlite":
+            # Refresh planner statistics so the new indexes get used
+            conn.execute(text("ANALYZE"))
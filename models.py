@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, CheckConstraint, Index
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, ForeignKey, Text, Computed
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -9,11 +9,13 @@ Base = declarative_base()
 class Patient(Base):
     __tablename__ = "patients"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     address = Column(Text)
     age = Column(Integer)
     sex = Column(String, CheckConstraint("sex IN ('M','F','Other')"))
     conditions = Column(Text)
+    patient_code = Column(String, unique=True, index=True, nullable=True)  # lab system patient id, e.g. PT001
+    date_of_birth = Column(Date, nullable=True)
 
     results = relationship("Results", back_populates="patient")
     letters = relationship("Letter")
@@ -21,7 +23,7 @@ class Patient(Base):
 class Results(Base):
     __tablename__ = "results"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"))
+    patient_id = Column(Integer, ForeignKey("patients.id"), index=True)
     test_name = Column(String)
     value = Column(String)
     unit = Column(String)
@@ -29,10 +31,29 @@ class Results(Base):
     reference_low = Column(String)
     reference_high = Column(String)
     source_file = Column(String)
-    batch_id = Column(String)
+    batch_id = Column(String, index=True)
+    sample_date = Column(Date, nullable=True)
+    # Parsed from value / reference_low / reference_high at ingest (see result_values.py)
+    value_num = Column(Float, nullable=True)
+    ref_low_num = Column(Float, nullable=True)
+    ref_high_num = Column(Float, nullable=True)
+    # -1 below range, 0 within, 1 above; NULL when the value or range isn't numeric
+    out_of_range = Column(Integer, Computed(
+        "CASE WHEN value_num IS NULL OR (ref_low_num IS NULL AND ref_high_num IS NULL) THEN NULL "
+        "WHEN value_num < ref_low_num THEN -1 "
+        "WHEN value_num > ref_high_num THEN 1 "
+        "ELSE 0 END",
+        persisted=False,
+    ))
 
     patient = relationship("Patient", back_populates="results")
 
+    __table_args__ = (
+        # "abnormal haemoglobin below X": test, then direction, then value range
+        Index("ix_results_test_out_of_range_value", "test_name", "out_of_range", "value_num"),
+        Index("ix_results_patient_out_of_range", "patient_id", "out_of_range"),
+    )
+
 
 class Letter(Base):
     __tablename__ = "letters"
@@ -46,4 +67,61 @@ class Letter(Base):
     approved_at = Column(DateTime, nullable=True)
     content = Column(Text, nullable=True)
     file_path = Column(String, nullable=True)
-    patient = relationship("Patient")
\ No newline at end of file
+    version = Column(Integer, default=1, server_default="1")  # bumped on every change, used for ETags
+    # Bumped only when the text changes; PATCH base_version is checked against it
+    content_version = Column(Integer, default=1, server_default="1")
+    patient = relationship("Patient")
+
+    __table_args__ = (
+        # Letter listings page newest first on (created_at, id), optionally filtered
+        Index("ix_letters_created_at_id", "created_at", "id"),
+        Index("ix_letters_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_letters_doctor_created_at_id", "doctor_name", "created_at", "id"),
+        Index("ix_letters_patient_created_at_id", "patient_id", "created_at", "id"),
+    )
+
+
+class LetterJob(Base):
+    __tablename__ = "letter_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_uid = Column(String, unique=True, nullable=False)
+    status = Column(String, default="queued")  # queued, running, done, failed
+    payload = Column(Text, nullable=False)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    letter_uid = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_letter_jobs_status_id", "status", "id"),
+    )
+
+
+class LetterCacheEntry(Base):
+    __tablename__ = "letter_cache"
+    cache_key = Column(String, primary_key=True)
+    model = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ResultSummary(Base):
+    """Running totals per test and unit, updated with every results upload."""
+    __tablename__ = "result_summary"
+    test_name = Column(String, primary_key=True)
+    unit = Column(String, primary_key=True, default="")
+    result_count = Column(Integer, nullable=False, default=0)
+    numeric_count = Column(Integer, nullable=False, default=0)   # results with a parsed value
+    ranged_count = Column(Integer, nullable=False, default=0)    # ... that also have a reference range
+    below_count = Column(Integer, nullable=False, default=0)
+    above_count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=False, default=0.0)
+    value_sum_sq = Column(Float, nullable=False, default=0.0)
+    value_min = Column(Float, nullable=True)
+    value_max = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
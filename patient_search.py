@@ -0,0 +1,129 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# Word index for ranked prefix matching, and a trigram index of names for typo-tolerant matching.
+# Both are external-content FTS5 tables over patients, kept in sync by triggers.
+SEARCH_TABLES = {
+    "patients_fts": (
+        "CREATE VIRTUAL TABLE patients_fts USING fts5("
+        "name, address, conditions, content='patients', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ),
+    "patients_trigram": (
+        "CREATE VIRTUAL TABLE patients_trigram USING fts5("
+        "name, content='patients', content_rowid='id', tokenize='trigram')"
+    ),
+}
+
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS patients_search_ai AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts(rowid, name, address, conditions)
+            VALUES (new.id, new.name, new.address, new.conditions);
+        INSERT INTO patients_trigram(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_search_ad AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, name, address, conditions)
+            VALUES ('delete', old.id, old.name, old.address, old.conditions);
+        INSERT INTO patients_trigram(patients_trigram, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS patients_search_au AFTER UPDATE OF name, address, conditions ON patients BEGIN
+        INSERT INTO patients_fts(patients_fts, rowid, name, address, conditions)
+            VALUES ('delete', old.id, old.name, old.address, old.conditions);
+        INSERT INTO patients_fts(rowid, name, address, conditions)
+            VALUES (new.id, new.name, new.address, new.conditions);
+        INSERT INTO patients_trigram(patients_trigram, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO patients_trigram(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+# bm25 column weights for patients_fts: a name match outranks an address or condition match
+NAME_WEIGHT, ADDRESS_WEIGHT, CONDITIONS_WEIGHT = 10.0, 1.0, 1.0
+
+# Typo matching looks at limit * FUZZY_CANDIDATES trigram hits and keeps names
+# sharing at least FUZZY_MIN_SHARED of the query's trigrams
+FUZZY_CANDIDATES = 5
+FUZZY_MIN_SHARED = 0.3
+
+
+def ensure_search_index(engine) -> bool:
+    """Create the search tables and triggers if needed. Returns False if SQLite lacks FTS5."""
+    try:
+        with engine.begin() as conn:
+            existing = {
+                row.name for row in conn.execute(
+                    text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('patients_fts', 'patients_trigram')")
+                )
+            }
+            for name, ddl in SEARCH_TABLES.items():
+                if name not in existing:
+                    conn.execute(text(ddl))
+                    # Index the patients that were already there
+                    conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+                    print(f"Built search index {name}")
+            for ddl in SEARCH_TRIGGERS:
+                conn.execute(text(ddl))
+    except OperationalError as e:
+        print(f"Patient search index unavailable, falling back to LIKE: {e}")
+        return False
+    return True
+
+
+def _terms(query: str):
+    return re.findall(r"\w+", query.lower())
+
+
+def _trigrams(terms):
+    return {term[i:i + 3] for term in terms for i in range(len(term) - 2)}
+
+
+def _filters(age, sex, params):
+    clauses = []
+    if age:
+        clauses.append("p.age = :age")
+        params["age"] = age
+    if sex:
+        clauses.append("p.sex = :sex")
+        params["sex"] = sex
+    return "".join(f" AND {c}" for c in clauses)
+
+
+def search_patient_ids(db, query: str, limit: int = 20, in_details: bool = False, age=None, sex=None):
+    """Patient ids best matching query, best first.
+
+    Every word must prefix-match the name (or address/conditions when in_details
+    is set). If nothing matches, names sharing enough trigrams with the query
+    are returned instead, which catches typos like "Willaims".
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    columns = "{name address conditions}" if in_details else "{name}"
+    params = {"match": f"{columns}: (" + " AND ".join(f'"{t}"*' for t in terms) + ")", "limit": limit}
+    rows = db.execute(text(
+        "SELECT p.id FROM patients_fts f JOIN patients p ON p.id = f.rowid "
+        "WHERE patients_fts MATCH :match" + _filters(age, sex, params) +
+        f" ORDER BY bm25(patients_fts, {NAME_WEIGHT}, {ADDRESS_WEIGHT}, {CONDITIONS_WEIGHT}) LIMIT :limit"
+    ), params).all()
+    ids = [row.id for row in rows]
+
+    trigrams = _trigrams(terms)
+    if ids or not trigrams:
+        return ids
+
+    params = {"match": " OR ".join(f'"{t}"' for t in sorted(trigrams)), "limit": limit * FUZZY_CANDIDATES}
+    rows = db.execute(text(
+        "SELECT p.id, p.name FROM patients_trigram t JOIN patients p ON p.id = t.rowid "
+        "WHERE patients_trigram MATCH :match" + _filters(age, sex, params) +
+        " ORDER BY bm25(patients_trigram) LIMIT :limit"
+    ), params).all()
+
+    # Keep names sharing enough of the query's trigrams, most shared first
+    scored = []
+    for row in rows:
+        shared = len(trigrams & _trigrams(_terms(row.name)))
+        if shared / len(trigrams) >= FUZZY_MIN_SHARED:
+            scored.append((-shared, row.id))
+    return [patient_id for _, patient_id in sorted(scored)[:limit]]
@@ -0,0 +1,51 @@
+import re
+from typing import Optional, Tuple
+
+# Lab results arrive as text ("7.8", "<0.5", "1,250") and reference ranges as
+# "115-165", "4.0 - 11.0", "<5", ">60" or "-2.0 to 2.0", often followed by units
+# or a note ("3.5-5.0 mmol/L", "0.5-1.2 (adult)"). These are parsed once, at
+# ingest, into numeric columns so abnormal results can be filtered in SQL.
+
+_NUMBER = r"[-+]?\d+(?:\.\d+)?"
+_VALUE_RE = re.compile(rf"^\s*(?:[<>]=?|≤|≥)?\s*({_NUMBER})")
+# Anything after the bounds (units, "(adult)") is ignored, as it is for values
+_RANGE_RE = re.compile(rf"^\s*({_NUMBER})\s*(?:-|–|—|to)\s*({_NUMBER})", re.IGNORECASE)
+_UPPER_RE = re.compile(rf"^\s*(?:<=?|≤)\s*({_NUMBER})")
+_LOWER_RE = re.compile(rf"^\s*(?:>=?|≥)\s*({_NUMBER})")
+
+# Values of Results.out_of_range, which SQLite computes from the numeric columns
+BELOW, WITHIN, ABOVE = -1, 0, 1
+
+
+def parse_number(text: Optional[str]) -> Optional[float]:
+    """Leading number of a result, ignoring any </> qualifier and trailing units. None if there isn't one."""
+    if not text:
+        return None
+    match = _VALUE_RE.match(text.replace(",", ""))
+    return float(match.group(1)) if match else None
+
+
+def parse_reference_range(text: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Split a reference range into its (low, high) bounds as text; an open end is None."""
+    if not text:
+        return None, None
+    text = text.replace(",", "")
+    match = _RANGE_RE.match(text)
+    if match:
+        return match.group(1), match.group(2)
+    match = _UPPER_RE.match(text)
+    if match:
+        return None, match.group(1)
+    match = _LOWER_RE.match(text)
+    if match:
+        return match.group(1), None
+    return None, None
+
+
+def numeric_values(value: Optional[str], reference_low: Optional[str], reference_high: Optional[str]) -> dict:
+    """The numeric Results columns for a result's text value and reference bounds."""
+    return {
+        "value_num": parse_number(value),
+        "ref_low_num": parse_number(reference_low),
+        "ref_high_num": parse_number(reference_high),
+    }
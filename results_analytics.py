@@ -0,0 +1,301 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Patient, Results, ResultSummary
+
+# Trend and cohort statistics over lab results. Rows are pulled out of SQLite
+# as columns (one NumPy array per field) and aggregated with vectorised NumPy
+# operations; nothing loops over results in Python.
+
+SUMMARY_CHUNK_SIZE = 5000
+UPSERT_BATCH = 500
+
+
+def _array(values: Sequence, dtype=float) -> np.ndarray:
+    # None becomes NaN (or NaT for dates)
+    return np.array(values, dtype=dtype)
+
+
+def _columns(rows, names: Sequence[str], dtypes: Dict[str, object]) -> Dict[str, np.ndarray]:
+    """Transpose fetched rows into one array per column."""
+    if not rows:
+        return {name: np.array([], dtype=dtypes.get(name, float)) for name in names}
+    return {name: _array(column, dtypes.get(name, float)) for name, column in zip(names, zip(*rows))}
+
+
+def _json(values: np.ndarray) -> List:
+    """Array as a JSON-ready list, with NaN and NaT as null."""
+    if values.dtype.kind == "M":
+        return np.where(np.isnat(values), None, np.datetime_as_string(values)).tolist()
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def out_of_range(values: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Vectorised Results.out_of_range: -1, 0, 1, or NaN where it would be NULL."""
+    flags = np.full(values.shape, np.nan)
+    known = ~np.isnan(values) & ~(np.isnan(low) & np.isnan(high))
+    below = known & (values < low)
+    above = known & ~below & (values > high)
+    flags[known] = 0
+    flags[below] = -1
+    flags[above] = 1
+    return flags
+
+
+def summarize(rows: Sequence[dict]) -> List[dict]:
+    """Per (test, unit) totals for a batch of parsed result rows, ready to add to result_summary."""
+    if not rows:
+        return []
+
+    tests = np.array([row["test_name"] for row in rows], dtype=object)
+    units = np.array([row.get("unit") or "" for row in rows], dtype=object)
+    values = _array([row.get("value_num") for row in rows])
+    flags = out_of_range(
+        values,
+        _array([row.get("ref_low_num") for row in rows]),
+        _array([row.get("ref_high_num") for row in rows]),
+    )
+
+    keys, groups = np.unique(tests + "\x1f" + units, return_inverse=True)
+    size = len(keys)
+    numeric = ~np.isnan(values)
+    filled = np.where(numeric, values, 0.0)
+
+    counts = np.bincount(groups, minlength=size)
+    numeric_counts = np.bincount(groups, weights=numeric, minlength=size)
+    ranged_counts = np.bincount(groups, weights=~np.isnan(flags), minlength=size)
+    below_counts = np.bincount(groups, weights=flags == -1, minlength=size)
+    above_counts = np.bincount(groups, weights=flags == 1, minlength=size)
+    sums = np.bincount(groups, weights=filled, minlength=size)
+    sums_sq = np.bincount(groups, weights=filled * filled, minlength=size)
+    minimums = np.full(size, np.inf)
+    maximums = np.full(size, -np.inf)
+    np.minimum.at(minimums, groups[numeric], values[numeric])
+    np.maximum.at(maximums, groups[numeric], values[numeric])
+
+    now = datetime.utcnow()
+    summaries = []
+    for i, key in enumerate(keys):
+        test_name, unit = key.split("\x1f", 1)
+        summaries.append({
+            "test_name": test_name,
+            "unit": unit,
+            "result_count": int(counts[i]),
+            "numeric_count": int(numeric_counts[i]),
+            "ranged_count": int(ranged_counts[i]),
+            "below_count": int(below_counts[i]),
+            "above_count": int(above_counts[i]),
+            "value_sum": float(sums[i]),
+            "value_sum_sq": float(sums_sq[i]),
+            "value_min": float(minimums[i]) if numeric_counts[i] else None,
+            "value_max": float(maximums[i]) if numeric_counts[i] else None,
+            "updated_at": now,
+        })
+    return summaries
+
+
+def summary_upserts(rows: Sequence[dict]):
+    """Statements adding a batch of parsed result rows to result_summary; run them in the upload's transaction."""
+    summaries = summarize(rows)
+    for start in range(0, len(summaries), UPSERT_BATCH):
+        stmt = sqlite_insert(ResultSummary).values(summaries[start:start + UPSERT_BATCH])
+        new, current = stmt.excluded, ResultSummary.__table__.c
+        yield stmt.on_conflict_do_update(
+            index_elements=["test_name", "unit"],
+            set_={
+                **{
+                    name: current[name] + new[name]
+                    for name in ("result_count", "numeric_count", "ranged_count", "below_count",
+                                 "above_count", "value_sum", "value_sum_sq")
+                },
+                # SQLite's two-argument min/max return NULL if either side is NULL
+                "value_min": func.min(func.coalesce(current.value_min, new.value_min),
+                                      func.coalesce(new.value_min, current.value_min)),
+                "value_max": func.max(func.coalesce(current.value_max, new.value_max),
+                                      func.coalesce(new.value_max, current.value_max)),
+                "updated_at": new.updated_at,
+            },
+        )
+
+
+SUMMARY_SOURCE_COLUMNS = (
+    Results.id, Results.test_name, Results.unit, Results.value_num, Results.ref_low_num, Results.ref_high_num,
+)
+
+
+def rebuild_summary(conn):
+    """Recompute result_summary from every stored result."""
+    conn.execute(delete(ResultSummary))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(*SUMMARY_SOURCE_COLUMNS)
+            .where(Results.id > last_id, Results.test_name.is_not(None))
+            .order_by(Results.id)
+            .limit(SUMMARY_CHUNK_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+        for stmt in summary_upserts(rows):
+            conn.execute(stmt)
+        last_id = rows[-1]["id"]
+
+
+def ensure_result_summary(engine):
+    """Build result_summary for results stored before it existed."""
+    with engine.begin() as conn:
+        has_summary = conn.execute(select(ResultSummary.test_name).limit(1)).first()
+        has_results = conn.execute(select(Results.id).limit(1)).first()
+        if has_results and not has_summary:
+            rebuild_summary(conn)
+            print("Built result summary")
+
+
+def patient_series(db, patient_id: int, test_name: str) -> dict:
+    """One patient's results for a test over time, as columns, with a least-squares trend."""
+    names = ("sample_date", "value_num", "ref_low_num", "ref_high_num", "out_of_range")
+    rows = db.execute(
+        select(Results.sample_date, Results.value_num, Results.ref_low_num, Results.ref_high_num,
+               Results.out_of_range, Results.unit)
+        .where(Results.patient_id == patient_id, Results.test_name == test_name)
+        .order_by(Results.sample_date, Results.id)
+    ).all()
+    units = sorted({row.unit for row in rows if row.unit})
+    cols = _columns([row[:5] for row in rows], names, {"sample_date": "datetime64[D]"})
+
+    dates, values = cols["sample_date"], cols["value_num"]
+    usable = ~np.isnat(dates) & ~np.isnan(values)
+    stats = {"count": int(len(values)), "numeric_count": int((~np.isnan(values)).sum())}
+    if stats["numeric_count"]:
+        numeric = values[~np.isnan(values)]
+        stats.update(
+            min=_number(numeric.min()),
+            max=_number(numeric.max()),
+            mean=_number(numeric.mean()),
+            latest=_number(numeric[-1]),
+            change=_number(numeric[-1] - numeric[0]),
+        )
+    days = (dates[usable] - dates[usable].min()).astype(float) if usable.any() else np.array([])
+    if len(np.unique(days)) >= 2:
+        slope, _ = np.polyfit(days, values[usable], 1)
+        stats["trend_per_30_days"] = _number(slope * 30)
+
+    return {
+        "patient_id": patient_id,
+        "test_name": test_name,
+        "units": units,
+        "dates": _json(dates),
+        "values": _json(values),
+        "ref_low": _json(cols["ref_low_num"]),
+        "ref_high": _json(cols["ref_high_num"]),
+        "out_of_range": _json(cols["out_of_range"]),
+        "stats": stats,
+    }
+
+
+def cohort_percentiles(
+    db,
+    test_name: str,
+    percentiles: Sequence[float],
+    unit: str = None,
+    sex: str = None,
+    age_min: int = None,
+    age_max: int = None,
+    latest_only: bool = False,
+    bins: int = 10,
+) -> dict:
+    """Distribution of a test's values across patients, optionally each patient's latest result only."""
+    query = (
+        select(Results.patient_id, Results.value_num)
+        .where(Results.test_name == test_name, Results.value_num.is_not(None))
+        .order_by(Results.patient_id, Results.sample_date, Results.id)
+    )
+    if unit:
+        query = query.where(Results.unit == unit)
+    if sex or age_min is not None or age_max is not None:
+        query = query.join(Patient, Patient.id == Results.patient_id)
+        if sex:
+            query = query.where(Patient.sex == sex)
+        if age_min is not None:
+            query = query.where(Patient.age >= age_min)
+        if age_max is not None:
+            query = query.where(Patient.age <= age_max)
+
+    cols = _columns(db.execute(query).all(), ("patient_id", "value_num"), {"patient_id": np.int64})
+    patients, values = cols["patient_id"], cols["value_num"]
+    if latest_only and len(values):
+        # Rows are sorted by patient then date, so each patient's last row is their latest
+        last = np.flatnonzero(np.r_[patients[1:] != patients[:-1], True])
+        patients, values = patients[last], values[last]
+
+    result = {
+        "test_name": test_name,
+        "unit": unit,
+        "count": int(len(values)),
+        "patients": int(len(np.unique(patients))),
+    }
+    if not len(values):
+        return result
+
+    counts, edges = np.histogram(values, bins=bins)
+    result.update(
+        mean=_number(values.mean()),
+        std=_number(values.std()),
+        min=_number(values.min()),
+        max=_number(values.max()),
+        percentiles={f"p{q:g}": _number(v) for q, v in zip(percentiles, np.percentile(values, percentiles))},
+        histogram={"edges": [round(float(e), 4) for e in edges], "counts": counts.tolist()},
+    )
+    return result
+
+
+def abnormal_rates(db, test_name: str = None, min_results: int = 1) -> List[dict]:
+    """Share of results below/above range per test and unit, from result_summary, highest first."""
+    query = select(ResultSummary).where(ResultSummary.ranged_count >= min_results)
+    if test_name:
+        query = query.where(ResultSummary.test_name == test_name)
+    summaries = db.execute(query).scalars().all()
+    if not summaries:
+        return []
+
+    cols = {
+        name: np.array([getattr(s, name) for s in summaries], dtype=float)
+        for name in ("numeric_count", "ranged_count", "below_count", "above_count", "value_sum", "value_sum_sq")
+    }
+    ranged = np.maximum(cols["ranged_count"], 1)
+    numeric = np.maximum(cols["numeric_count"], 1)
+    below_rate = cols["below_count"] / ranged
+    above_rate = cols["above_count"] / ranged
+    mean = cols["value_sum"] / numeric
+    std = np.sqrt(np.maximum(cols["value_sum_sq"] / numeric - mean * mean, 0))
+
+    order = np.argsort(-(below_rate + above_rate), kind="stable")
+    return [
+        {
+            "test_name": summaries[i].test_name,
+            "unit": summaries[i].unit,
+            "results": summaries[i].result_count,
+            "with_range": summaries[i].ranged_count,
+            "below": summaries[i].below_count,
+            "above": summaries[i].above_count,
+            "below_rate": _number(below_rate[i]),
+            "above_rate": _number(above_rate[i]),
+            "abnormal_rate": _number(below_rate[i] + above_rate[i]),
+            "mean": _number(mean[i]) if summaries[i].numeric_count else None,
+            "std": _number(std[i]) if summaries[i].numeric_count else None,
+            "min": summaries[i].value_min,
+            "max": summaries[i].value_max,
+        }
+        for i in order
+    ]
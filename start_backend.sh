@@ -29,5 +29,7 @@ echo ""
 echo "✅ Starting FastAPI server..."
 echo "📖 API Documentation: http://10.249.84.213:8000/docs"
 echo ""
-python app.py
+# Run through uvicorn rather than `python app.py`: spawned PDF workers re-import
+# the __main__ script, and app.py is far heavier than uvicorn's entry point
+python -m uvicorn app:app --host 0.0.0.0 --port 8000
 
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark the recent-letters query as a sync def endpoint (threadpool +
+SessionLocal) against an async def endpoint (AsyncSession over aiosqlite)
+under concurrent load.
+
+Each case is run on its own and again while slow sync requests (standing in
+for PDF renders and LLM calls) hold threadpool slots, which is where the sync
+endpoint queues up behind them.
+
+    python tests/bench_async_db.py [letters] [requests]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import make_engine, make_async_engine
+from migrations import upgrade_schema
+from models import Patient, Letter
+
+LETTERS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+CONCURRENCY = [1, 20, 100]
+SLOW_REQUESTS = 40  # anyio's default threadpool size
+SLOW_SECONDS = 0.5
+
+
+def seed(engine):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Patient), [{"name": f"Patient {i}", "age": 40, "sex": "F"} for i in range(1000)])
+        conn.execute(insert(Letter), [
+            {
+                "patient_id": random.randint(1, 1000),
+                "doctor_name": f"Dr. {random.randint(1, 40)}",
+                "status": random.choice(["Draft", "Approved", "Rejected"]),
+                "letter_uid": uuid.uuid4().hex[:12],
+                "created_at": start + timedelta(minutes=i),
+                "content": "Your results are within the normal range.",
+            }
+            for i in range(LETTERS)
+        ])
+
+
+def summary(l: Letter):
+    return {"id": l.letter_uid, "status": l.status, "date": l.created_at.strftime("%Y-%m-%d")}
+
+
+def build_app(engine, async_engine):
+    SessionLocal = sessionmaker(bind=engine, autoflush=False)
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.get("/sync/recent")
+    def sync_recent(db=Depends(get_db)):
+        letters = db.query(Letter).order_by(Letter.created_at.desc(), Letter.id.desc()).limit(10).all()
+        return [summary(l) for l in letters]
+
+    @app.get("/async/recent")
+    async def async_recent(db=Depends(get_async_db)):
+        letters = (await db.scalars(
+            select(Letter).order_by(Letter.created_at.desc(), Letter.id.desc()).limit(10)
+        )).all()
+        return [summary(l) for l in letters]
+
+    @app.get("/slow")
+    def slow():
+        time.sleep(SLOW_SECONDS)
+
+    return app
+
+
+async def load(client, path, concurrency):
+    latencies = []
+    remaining = iter(range(REQUESTS))
+
+    async def worker():
+        for _ in remaining:
+            t0 = time.perf_counter()
+            r = await client.get(path)
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return REQUESTS / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+async def slow_traffic(client, stop):
+    async def worker():
+        while not stop.is_set():
+            await client.get("/slow")
+
+    await asyncio.gather(*(worker() for _ in range(SLOW_REQUESTS)))
+
+
+async def run(app, async_engine):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/sync/recent")
+        await client.get("/async/recent")
+
+        print(f"{'endpoint':<16}{'background':<12}{'clients':>8}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+        print("-" * 66)
+        for background in (False, True):
+            for concurrency in CONCURRENCY:
+                for path in ("/sync/recent", "/async/recent"):
+                    stop = asyncio.Event()
+                    slow = asyncio.ensure_future(slow_traffic(client, stop)) if background else None
+                    if slow:
+                        await asyncio.sleep(0.1)
+                    rps, p50, p95 = await load(client, path, concurrency)
+                    if slow:
+                        stop.set()
+                        await slow
+                    label = f"{SLOW_REQUESTS} slow" if background else "-"
+                    print(f"{path:<16}{label:<12}{concurrency:>8}{rps:>10.0f}{p50:>10.1f}{p95:>10.1f}")
+
+    await async_engine.dispose()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = make_engine(f"sqlite:///{path}")
+        upgrade_schema(engine)
+        print(f"🌱 Seeding {LETTERS:,} letters...\n")
+        seed(engine)
+
+        async_engine = make_async_engine(f"sqlite+aiosqlite:///{path}")
+        asyncio.run(run(build_app(engine, async_engine), async_engine))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark patient name search: the old ILIKE '%name%' scan against the FTS5
+prefix index and the trigram typo-tolerant fallback.
+
+    python tests/bench_patient_search.py [patients]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from database import make_engine
+from generate_fake_data import FIRST_NAMES, LAST_NAMES, STREETS, CITIES, CONDITIONS
+from migrations import upgrade_schema
+from models import Patient
+from patient_search import ensure_search_index, search_patient_ids
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+REPEATS = 50
+LIMIT = 20
+
+
+def seed(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(Patient), [
+            {
+                # A handful of rare surnames alongside the common ones
+                "name": f"{random.choice(FIRST_NAMES)} "
+                        f"{'Featherstonehaugh' if i % 10_000 == 0 else random.choice(LAST_NAMES)}",
+                "age": random.randint(18, 90),
+                "sex": random.choice(["M", "F"]),
+                "address": f"{random.randint(1, 200)} {random.choice(STREETS)}, {random.choice(CITIES)}",
+                "conditions": random.choice(CONDITIONS),
+            }
+            for i in range(PATIENTS)
+        ])
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), len(result)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        upgrade_schema(engine)
+        print(f"🌱 Seeding {PATIENTS:,} patients...")
+        seed(engine)
+
+        t0 = time.perf_counter()
+        ensure_search_index(engine)
+        print(f"🔎 Built search indexes in {time.perf_counter() - t0:.1f}s\n")
+
+        db = sessionmaker(bind=engine)()
+        cases = ["jenn", "sarah tho", "featherst", "Willaims"]
+
+        print(f"{'query':<14}{'ilike (ms)':>12}{'hits':>6}{'index (ms)':>12}{'hits':>6}")
+        print("-" * 50)
+        for term in cases:
+            # The search endpoint as it was: every ILIKE match, unranked
+            ilike_ms, ilike_hits = timed(
+                lambda: db.query(Patient).filter(Patient.name.ilike(f"%{term}%")).all()
+            )
+            index_ms, index_hits = timed(lambda: search_patient_ids(db, term, limit=LIMIT))
+            print(f"{term:<14}{ilike_ms:>12.2f}{ilike_hits:>6}{index_ms:>12.2f}{index_hits:>6}")
+
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot SQLite queries with and without the secondary indexes.
+
+Seeds a throwaway database with 100k+ letters and times the queries app.py
+runs, first on bare tables and then after upgrade_schema() adds the indexes.
+
+    python tests/bench_queries.py [letters]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from database import make_engine
+from migrations import upgrade_schema
+from models import Base, Patient, Results, Letter
+
+LETTERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+PATIENTS = LETTERS // 5
+RESULTS = LETTERS * 2
+REPEATS = 50
+
+
+def seed(engine):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Patient), [
+            {"name": f"Patient {i}", "age": random.randint(18, 90), "sex": random.choice(["M", "F"])}
+            for i in range(PATIENTS)
+        ])
+        conn.execute(insert(Letter), [
+            {
+                "patient_id": random.randint(1, PATIENTS),
+                "doctor_name": f"Dr. {random.randint(1, 40)}",
+                "status": random.choice(["Draft", "Approved", "Rejected"]),
+                "letter_uid": uuid.uuid4().hex[:12],
+                "created_at": start + timedelta(minutes=i),
+                "content": "Your results are within the normal range.",
+            }
+            for i in range(LETTERS)
+        ])
+        conn.execute(insert(Results), [
+            {
+                "patient_id": random.randint(1, PATIENTS),
+                "test_name": "Haemoglobin",
+                "value": str(random.randint(100, 180)),
+                "unit": "g/L",
+                "batch_id": f"batch-{i // 8}",
+            }
+            for i in range(RESULTS)
+        ])
+
+
+def queries(db):
+    patient_id = random.randint(1, PATIENTS)
+    return {
+        "recent letters": lambda: db.query(Letter).order_by(Letter.created_at.desc()).limit(10).all(),
+        "recent drafts": lambda: db.query(Letter).filter(Letter.status == "Draft")
+            .order_by(Letter.created_at.desc()).limit(10).all(),
+        "letters for patient": lambda: db.query(Letter).filter(Letter.patient_id == patient_id).all(),
+        "results for patient": lambda: db.query(Results).filter(Results.patient_id == patient_id).all(),
+        "results in batch": lambda: db.query(Results).filter(Results.batch_id == "batch-4242").all(),
+        "patient by name": lambda: db.query(Patient).filter(Patient.name == f"Patient {patient_id}").all(),
+    }
+
+
+def run(engine):
+    db = sessionmaker(bind=engine)()
+    timings = {}
+    for name, query in queries(db).items():
+        samples = []
+        for _ in range(REPEATS):
+            t0 = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - t0) * 1000)
+            db.expunge_all()
+        timings[name] = statistics.median(samples)
+    db.close()
+    return timings
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+        print(f"🌱 Seeding {LETTERS:,} letters, {PATIENTS:,} patients, {RESULTS:,} results...")
+        seed(engine)
+
+        before = run(engine)
+        upgrade_schema(engine)
+        after = run(engine)
+        engine.dispose()
+
+    print(f"\n{'query':<22}{'no index (ms)':>15}{'indexed (ms)':>15}{'speed-up':>10}")
+    print("-" * 62)
+    for name in before:
+        print(f"{name:<22}{before[name]:>15.2f}{after[name]:>15.2f}{before[name] / after[name]:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
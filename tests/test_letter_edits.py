@@ -0,0 +1,121 @@
+"""
+Check that autosave edits held in LetterEditBuffer reach the database, even
+when a write fails and has to be retried.
+
+    python -m pytest tests/test_letter_edits.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import make_engine
+from letter_edits import EditConflict, LetterEditBuffer, apply_edits
+from migrations import upgrade_schema
+from models import Letter, Patient
+
+
+@pytest.fixture
+def engine():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'test.db')}")
+        upgrade_schema(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(Patient), [{"name": "Patient", "age": 40, "sex": "F"}])
+            conn.execute(insert(Letter), [{"patient_id": 1, "letter_uid": "letter", "content": "Hello world"}])
+        yield engine
+        engine.dispose()
+
+
+class FlakySession(Session):
+    """Session whose commit fails while `failures` is above zero."""
+
+    failures = 0
+
+    def commit(self):
+        if FlakySession.failures > 0:
+            FlakySession.failures -= 1
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+        super().commit()
+
+
+def stored(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(Letter.content, Letter.content_version)).one()
+
+
+def make_buffer(engine, **kwargs):
+    saved = []
+    buffer = LetterEditBuffer(
+        sessionmaker(bind=engine, class_=FlakySession), saved.append, delay=60, max_delay=60, **kwargs
+    )
+    return buffer, saved
+
+
+def test_edits_are_written_in_one_flush(engine):
+    buffer, saved = make_buffer(engine)
+    db = Session(bind=engine)
+    assert buffer.patch(db, "letter", 1, [(5, 5, " there")]) == 2
+    assert buffer.patch(db, "letter", 2, [(0, 0, ">")]) == 3
+    with pytest.raises(EditConflict):
+        buffer.patch(db, "letter", 2, [(0, 0, "!")])
+    db.close()
+
+    assert stored(engine) == ("Hello world", 1)
+    assert buffer.flush("letter")
+    assert stored(engine) == (">Hello there world", 3)
+    assert [letter.content_version for letter in saved] == [3]
+
+
+def test_failed_write_keeps_the_edits(engine):
+    buffer, saved = make_buffer(engine, retry_delay=60)
+    db = Session(bind=engine)
+    assert buffer.patch(db, "letter", 1, [(5, 5, " there")]) == 2
+
+    FlakySession.failures = 1
+    assert not buffer.flush("letter")
+    assert buffer.has_pending("letter")
+    assert stored(engine) == ("Hello world", 1)
+
+    # Still accepted against the version PATCH handed out
+    assert buffer.patch(db, "letter", 2, [(0, 0, ">")]) == 3
+    db.close()
+
+    assert buffer.flush("letter")
+    assert not buffer.has_pending("letter")
+    assert stored(engine) == (">Hello there world", 3)
+    assert len(saved) == 1
+
+
+def test_failed_write_is_retried(engine):
+    buffer, saved = make_buffer(engine, retry_delay=0.05)
+    db = Session(bind=engine)
+    buffer.patch(db, "letter", 1, [(11, 11, "!")])
+    db.close()
+
+    FlakySession.failures = 2
+    assert not buffer.flush("letter")
+
+    deadline = time.monotonic() + 5
+    while buffer.has_pending("letter") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert FlakySession.failures == 0
+    assert stored(engine) == ("Hello world!", 2)
+    assert len(saved) == 1
+
+
+def test_apply_edits_counts_utf16_units():
+    assert apply_edits("I 😀 it", [(5, 7, "love")]) == "I 😀 love"
+    # 😀 is U+D83D U+DE00 and 😁 is U+D83D U+DE01: the browser's diff sends only the low half
+    assert apply_edits("I 😀 it", [(3, 4, "\ude01")]) == "I 😁 it"
+    with pytest.raises(ValueError):
+        apply_edits("I 😀 it", [(3, 4, "")])
+    with pytest.raises(ValueError):
+        apply_edits("Hi", [(1, 5, "")])
@@ -0,0 +1,132 @@
+"""
+Check how many SQL statements each letter endpoint runs, so an N+1 or a stray
+refresh shows up as a failing test rather than a slow dashboard.
+
+    python -m pytest tests/test_query_counts.py
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# Point the app at a throwaway database before it's imported
+_tmp = tempfile.mkdtemp()
+os.environ["NHSCRIBE_DB_PATH"] = os.path.join(_tmp, "test.db")
+os.environ["NHSCRIBE_LETTER_STORAGE"] = "db"
+os.environ["NHSCRIBE_WARM_UP_MODEL"] = "0"
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+import app as scribe
+from models import Letter, Patient
+
+LETTERS = 25
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Entering the client runs startup, which creates the tables
+    with TestClient(scribe.app) as client:
+        with scribe.engine.begin() as conn:
+            conn.execute(insert(Patient), [{"name": f"Patient {i}", "age": 40, "sex": "F"} for i in range(5)])
+            conn.execute(insert(Letter), [
+                {
+                    "patient_id": i % 5 + 1,
+                    "doctor_name": "Dr. Who",
+                    "status": "Draft",
+                    "letter_uid": f"letter{i}",
+                    "content": f"Letter number {i}.",
+                }
+                for i in range(LETTERS)
+            ])
+        yield client
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [scribe.engine, scribe.async_engine.sync_engine]
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+
+
+def test_recent_letters_is_one_query(client):
+    with count_queries() as statements:
+        r = client.get("/letters/recent")
+    assert r.status_code == 200
+    assert len(r.json()) == 10
+    assert all(letter["patientName"] for letter in r.json())
+    assert len(statements) == 1
+
+
+def test_letter_page_is_one_query_per_call(client):
+    with count_queries() as statements:
+        r = client.get("/letters", params={"limit": 20})
+    assert r.status_code == 200
+    assert len(r.json()["letters"]) == 20
+    # The capped count and the page itself
+    assert len(statements) == 2
+
+
+def test_get_letter_is_one_query(client):
+    with count_queries() as statements:
+        r = client.get("/letters/letter3")
+    assert r.status_code == 200
+    assert r.json()["patientName"] == "Patient 3"
+    assert len(statements) == 1
+
+    with count_queries() as statements:
+        r = client.get("/letters/letter3", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
+    assert len(statements) == 1
+
+
+def test_update_content_loads_once_and_writes_once(client):
+    with count_queries() as statements:
+        r = client.put("/letters/letter4/content", json={"content": "Updated."})
+    assert r.status_code == 200
+    assert r.json()["content"] == "Updated."
+    assert r.json()["patientName"] == "Patient 4"
+    assert len(statements) == 2
+    assert statements[1].startswith("UPDATE")
+
+
+def test_update_status_loads_once_and_writes_once(client):
+    with count_queries() as statements:
+        r = client.patch("/letters/letter5/status", json={"new_status": "Approved"})
+    assert r.status_code == 200
+    assert r.json()["status"] == "Approved"
+    assert len(statements) == 2
+
+
+def test_pdf_is_one_query(client):
+    with count_queries() as statements:
+        r = client.get("/letters/letter6/pdf")
+    assert r.status_code == 200
+    assert r.content.startswith(b"%PDF")
+    assert len(statements) == 1
+
+
+def test_save_letter_is_one_insert(client):
+    db = scribe.SessionLocal()
+    try:
+        with count_queries() as statements:
+            result = scribe.save_letter(db, {"patient": {"id": 1, "name": "Patient 0"}}, "New letter.")
+    finally:
+        db.close()
+    assert result["letter_id"]
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT")
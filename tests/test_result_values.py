@@ -0,0 +1,61 @@
+"""
+Check that lab values and reference ranges parse the way they're written in
+real exports, units and notes included.
+
+    python -m pytest tests/test_result_values.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from result_values import numeric_values, parse_number, parse_reference_range
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("7.8", 7.8),
+    ("<0.5", 0.5),
+    (">= 60", 60.0),
+    ("1,250", 1250.0),
+    ("4.2 mmol/L", 4.2),
+    ("-1.5", -1.5),
+    ("Positive", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("115-165", ("115", "165")),
+    ("4.0 - 11.0", ("4.0", "11.0")),
+    ("3.5–5.0", ("3.5", "5.0")),
+    ("-2.0 to 2.0", ("-2.0", "2.0")),
+    ("1,000-4,000", ("1000", "4000")),
+    # Trailing units and notes
+    ("3.5-5.0 mmol/L", ("3.5", "5.0")),
+    ("115-165 g/L", ("115", "165")),
+    ("0.5-1.2 (adult)", ("0.5", "1.2")),
+    ("150-400 x10^9/L", ("150", "400")),
+    # Open-ended
+    ("<5", (None, "5")),
+    ("<= 5.7 %", (None, "5.7")),
+    (">60", ("60", None)),
+    ("> 1.0 mmol/L", ("1.0", None)),
+    # Not a range
+    ("Negative", (None, None)),
+    ("See report", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_parse_reference_range(text, expected):
+    assert parse_reference_range(text) == expected
+
+
+def test_numeric_values():
+    low, high = parse_reference_range("133-146 mmol/L")
+    assert numeric_values("150", low, high) == {"value_num": 150.0, "ref_low_num": 133.0, "ref_high_num": 146.0}
+    assert numeric_values("Haemolysed", None, None) == {"value_num": None, "ref_low_num": None, "ref_high_num": None}